@@ -0,0 +1,275 @@
+"""
+scaling benchmarks of scans and ingest on synthetic packages,
+results are saved as JSON to be compared between commits, e.g.
+
+    python benchmark/bench.py --modules 100 1000 -o before.json
+    python benchmark/bench.py --modules 100 1000 --compare before.json
+"""
+import sys
+from pathlib import Path
+
+PYGDB_DIR = Path(__file__).resolve().parent.parent / 'pygdb'
+sys.path.insert(0, str(PYGDB_DIR))
+
+from svisitor import SVisitor
+from sgraph import SGraph
+from profiling import ScanProfile
+from logging_settings import logger
+from synthetic import PackageSpec, generate_package
+from recording import RecordingDriver
+
+import argparse
+import asyncio
+import gc
+import importlib.util
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+# metrics compared between results, lower is better
+METRICS = ['scan', 'peak_memory', 'batches', 'ingest']
+
+# differences below these are noise, in seconds and bytes
+NOISE = {'time': 0.005, 'memory': 256 * 1024}
+
+
+def load_main():
+    """
+    pygdb/__main__.py as a module, for Connector and write_sgraph
+    """
+    spec = importlib.util.spec_from_file_location('pygdb_main', PYGDB_DIR / '__main__.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def scan_once(root: Path, jobs: int, trace_memory: bool) -> Tuple[SVisitor, ScanProfile]:
+    gc.collect()
+    profile = ScanProfile(trace_memory=trace_memory)
+    sv = SVisitor()
+    sv.scan_package(root, jobs=jobs, profile=profile)
+    profile.finish()
+    return sv, profile
+
+
+def time_batches(sgraph: SGraph, batch_size: int) -> float:
+    """
+    time to build all node and edge batches, the parameters of the write transactions
+    """
+    start = time.perf_counter()
+    for _ in sgraph.node_batches(batch_size):
+        pass
+    for _ in sgraph.edge_batches(batch_size):
+        pass
+    return round(time.perf_counter() - start, 6)
+
+
+async def time_ingest(main, sgraph: SGraph, batch_size: int, concurrency: int) -> Tuple[float, RecordingDriver]:
+    driver = RecordingDriver()
+    args = argparse.Namespace(batch_size=batch_size, concurrency=concurrency)
+    async with main.Connector(driver=driver) as connector:
+        start = time.perf_counter()
+        await main.write_sgraph(args, connector, sgraph)
+        return round(time.perf_counter() - start, 6), driver
+
+
+def run_spec(spec: PackageSpec, args, main) -> Dict:
+    """
+    best of args.repeat runs for times,
+    memory is measured in a run of its own since tracing slows the passes down
+    """
+    with tempfile.TemporaryDirectory(prefix='pygdb-bench-') as out_dir:
+        root = generate_package(out_dir, spec)
+        phases: Dict[str, List[float]] = {}
+        scans = []
+        for _ in range(args.repeat):
+            sv, profile = scan_once(root, args.jobs, trace_memory=False)
+            for record in profile.phases:
+                phases.setdefault(record['phase'], []).append(record['wall'])
+            scans.append(sum(record['wall'] for record in profile.phases))
+        _, memory_profile = scan_once(root, args.jobs, trace_memory=True)
+
+    sgraph = sv.sgraph
+    batches = min(time_batches(sgraph, args.batch_size) for _ in range(args.repeat))
+    ingests = [asyncio.run(time_ingest(main, sgraph, args.batch_size, args.concurrency)) for _ in range(args.repeat)]
+    ingest, driver = min(ingests, key=lambda item: item[0])
+
+    return {
+        'spec': spec._asdict(),
+        'nodes': len(sgraph.snodes),
+        'edges': len(sgraph.sedges),
+        'scan': min(scans),
+        'phases': {phase: min(times) for phase, times in phases.items()},
+        'peak_memory': memory_profile.peak_memory(),
+        'phase_memory': {record['phase']: record.get('traced_peak') for record in memory_profile.phases},
+        'batches': batches,
+        'ingest': ingest,
+        'transactions': driver.transactions,
+        'rows': sum(driver.rows.values()),
+    }
+
+
+def commit_of(path: Path) -> str | None:
+    """
+    commit checked out at path, with -dirty if tracked files changed
+    """
+    try:
+        commit = subprocess.run(['git', '-C', str(path), 'rev-parse', '--short', 'HEAD'], check=True, capture_output=True, text=True).stdout.strip()
+        status = subprocess.run(['git', '-C', str(path), 'status', '--porcelain', '--untracked-files=no'], check=True, capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if status.strip() else '')
+
+
+def compare(old: Dict, new: Dict, threshold: float) -> List[str]:
+    """
+    print the change of each metric for specs in both results,
+    returns the regressions above threshold
+    """
+    old_results = {PackageSpec(**result['spec']): result for result in old['results']}
+    regressions = []
+    print(f'{"spec":<40} {"metric":<22} {old.get("commit") or "old":>14} {new.get("commit") or "new":>14} {"change":>8}')
+    for result in new['results']:
+        spec = PackageSpec(**result['spec'])
+        if (previous := old_results.get(spec)) is None:
+            continue
+        metrics = [*METRICS, *(f'phases.{phase}' for phase in result['phases'])]
+        for metric in metrics:
+            before, after = value_of(previous, metric), value_of(result, metric)
+            if before is None or after is None:
+                continue
+            noise = NOISE['memory'] if metric == 'peak_memory' else NOISE['time']
+            change = (after - before) / before if before else 0.0
+            flag = ''
+            if after - before > noise and change > threshold:
+                flag = ' !'
+                regressions.append(f'{metric} of modules={spec.modules}: {change:+.1%}')
+            label = f'modules={spec.modules} fanout={spec.fanout} depth={spec.depth}'
+            print(f'{label:<40} {metric:<22} {format_value(metric, before):>14} {format_value(metric, after):>14} {change:>+8.1%}{flag}')
+    return regressions
+
+
+def value_of(result: Dict, metric: str) -> float | None:
+    if metric.startswith('phases.'):
+        return result['phases'].get(metric[len('phases.'):])
+    return result.get(metric)
+
+
+def format_value(metric: str, value: float) -> str:
+    return f'{value / 1024**2:.2f} MiB' if metric == 'peak_memory' else f'{value * 1000:.1f} ms'
+
+
+if __name__ == '__main__':
+    defaults = PackageSpec()
+    parser = argparse.ArgumentParser(description='PyGDB benchmarks on synthetic packages')
+
+    parser.add_argument(
+        '-m', '--modules',
+        type=int,
+        nargs='+',
+        default=[100, 300, 1000],
+        help='module counts of the packages benchmarked'
+    )
+
+    spec_group = parser.add_argument_group('synthetic packages')
+    for field, value in defaults._asdict().items():
+        if field == 'modules':
+            continue
+        spec_group.add_argument(
+            f'--{field.replace("_", "-")}',
+            type=type(value),
+            default=value,
+            help=f'default {value}'
+        )
+
+    parser.add_argument(
+        '-r', '--repeat',
+        type=int,
+        default=3,
+        help='runs per package, the best one is kept'
+    )
+
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help='number of processes summarizing modules'
+    )
+
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=5000,
+        help='number of nodes or edges written per transaction'
+    )
+
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=4,
+        help='maximum number of write transactions in flight'
+    )
+
+    parser.add_argument(
+        '-o', '--output',
+        type=str,
+        default=None,
+        help='results file, benchmark/results/<commit>.json by default'
+    )
+
+    parser.add_argument(
+        '--compare',
+        type=str,
+        default=None,
+        help='results file of another commit to compare with'
+    )
+
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.1,
+        help='relative slowdown reported as a regression, the exit status is 1 if there is any'
+    )
+
+    args = parser.parse_args()
+    # the scans log at every step, which would be timed as well
+    logger.setLevel(logging.CRITICAL)
+    main = load_main()
+
+    commit = commit_of(PYGDB_DIR)
+    results = {
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'settings': {'repeat': args.repeat, 'jobs': args.jobs, 'batch_size': args.batch_size, 'concurrency': args.concurrency},
+        'results': [],
+    }
+    for modules in args.modules:
+        spec = PackageSpec(modules=modules, **{field: getattr(args, field) for field in defaults._fields if field != 'modules'})
+        result = run_spec(spec, args, main)
+        results['results'].append(result)
+        print(
+            f'modules={modules}: {result["nodes"]} nodes, {result["edges"]} edges, scan {result["scan"]:.3f} s, '
+            f'peak {result["peak_memory"] / 1024**2:.1f} MiB, batches {result["batches"]:.3f} s, ingest {result["ingest"]:.3f} s'
+        )
+
+    output = Path(args.output) if args.output is not None else Path(__file__).resolve().parent / 'results' / f'{commit or "unknown"}.json'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'Saved results to {output}')
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), results, args.threshold)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,64 @@
+"""
+in-process stand-in for the async Neo4j driver used by Connector,
+queries are recorded instead of being sent so that ingest can be
+timed without a server
+"""
+import asyncio
+from collections import Counter
+from typing import Dict, List, Tuple
+
+
+class RecordingTransaction:
+    def __init__(self, driver: 'RecordingDriver'):
+        self.driver = driver
+
+    async def run(self, query: str, **parameters) -> None:
+        self.driver.record(query, parameters)
+        # lets other sessions run, as waiting for the server would
+        await asyncio.sleep(0)
+
+
+class RecordingSession:
+    def __init__(self, driver: 'RecordingDriver'):
+        self.driver = driver
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def execute_write(self, transaction_function, **kwargs):
+        self.driver.transactions += 1
+        return await transaction_function(RecordingTransaction(self.driver), **kwargs)
+
+    async def close(self) -> None:
+        pass
+
+
+class RecordingDriver:
+    """
+    counts transactions and the rows of the batches written with each query,
+    keep_queries also keeps every (query, parameters) for inspection
+    """
+    def __init__(self, keep_queries: bool = False):
+        self.keep_queries = keep_queries
+        self.queries: List[Tuple[str, Dict]] = []
+        self.transactions = 0
+        # {first line of a query: rows written with it}
+        self.rows: Counter = Counter()
+
+    def record(self, query: str, parameters: Dict) -> None:
+        key = next((line.strip() for line in query.splitlines() if line.strip().startswith(('MERGE', 'CREATE'))), query.strip())
+        self.rows[key] += sum(len(value) for value in parameters.values() if isinstance(value, list))
+        if self.keep_queries:
+            self.queries.append((query, parameters))
+
+    def session(self, database=None) -> RecordingSession:
+        return RecordingSession(self)
+
+    def verify_connectivity(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,123 @@
+"""
+generator of synthetic packages for benchmarks,
+deterministic for a given PackageSpec
+"""
+import random
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Union
+
+
+class PackageSpec(NamedTuple):
+    # modules in the package, spread over its subpackages
+    modules: int = 100
+    # levels of subpackages below the root and subpackages per package
+    depth: int = 2
+    branching: int = 3
+    # modules imported by each module
+    fanout: int = 4
+    # share of imports of a module generated after the importing one,
+    # the others import earlier modules, so 0 gives no import cycles
+    cycle_rate: float = 0.1
+    # per module, methods per class
+    classes: int = 3
+    functions: int = 5
+    methods: int = 3
+    # length of the attribute chains in method bodies, e.g. self.link.link.method()
+    chain: int = 3
+    seed: int = 0
+
+    def label(self) -> str:
+        return ','.join(f'{field}={value}' for field, value in self._asdict().items())
+
+
+def package_dirs(spec: PackageSpec) -> List[List[str]]:
+    """
+    paths of all packages, the root first and then level by level
+    """
+    dirs, level = [[]], [[]]
+    for depth in range(spec.depth):
+        level = [parent + [f'p{depth}_{idx}'] for parent in level for idx in range(spec.branching)]
+        dirs.extend(level)
+    return dirs
+
+
+def module_source(idx: int, spec: PackageSpec, imports: List[int], module_names: Dict[int, str], rng: random.Random) -> str:
+    lines = [f'"""synthetic module {idx}"""']
+    for target in imports:
+        # alternate between the import forms the scanner resolves
+        if target % 2:
+            lines.append(f'from {module_names[target]} import f{target}_0, C{target}_0')
+        else:
+            lines.append(f'import {module_names[target]}')
+    lines.append('')
+    lines.append(f'CONST = {idx}')
+
+    def call(target: int) -> str:
+        return f'f{target}_0(value)' if target % 2 else f'{module_names[target]}.f{target}_0(value)'
+
+    for fn in range(spec.functions):
+        lines += [
+            '',
+            '',
+            f'def f{idx}_{fn}(value):',
+            f'    """function {fn} of module {idx}"""',
+            f'    total = value + CONST + {fn}',
+        ]
+        if imports:
+            lines.append(f'    total += {call(rng.choice(imports))}')
+        if fn:
+            lines.append(f'    total += f{idx}_{fn - 1}(total)')
+        lines.append('    return total')
+
+    for cls in range(spec.classes):
+        if imports and (base := rng.choice(imports)) % 2:
+            bases = f'(C{base}_0)'
+        else:
+            bases = f'(C{idx}_{cls - 1})' if cls else ''
+        lines += [
+            '',
+            '',
+            f'class C{idx}_{cls}{bases}:',
+            f'    """class {cls} of module {idx}"""',
+            f'    size = {cls}',
+            '',
+            '    def __init__(self, link=None):',
+            '        self.link = link',
+            '        self.count = 0',
+        ]
+        for method in range(spec.methods):
+            chain = '.'.join(['self'] + ['link'] * spec.chain)
+            lines += [
+                '',
+                f'    def method_{method}(self, value):',
+                f'        self.count += f{idx}_{method % max(spec.functions, 1)}(value)' if spec.functions else '        self.count += value',
+                f'        return {chain}.method_{method}(value) if {chain} else self.count',
+            ]
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def generate_package(out_dir: Union[str, Path], spec: PackageSpec, name: str = 'synthetic') -> Path:
+    """
+    write the package described by spec to out_dir/name and return its path
+    """
+    rng = random.Random(spec.seed)
+    root = Path(out_dir) / name
+    dirs = package_dirs(spec)
+    for package in dirs:
+        (root.joinpath(*package)).mkdir(parents=True, exist_ok=True)
+        (root.joinpath(*package) / '__init__.py').write_text(f'"""package {".".join([name, *package])}"""\n')
+
+    placement = {idx: dirs[idx % len(dirs)] for idx in range(spec.modules)}
+    module_names = {idx: '.'.join([name, *placement[idx], f'm{idx}']) for idx in range(spec.modules)}
+
+    for idx in range(spec.modules):
+        imports = set()
+        for _ in range(min(spec.fanout, spec.modules - 1)):
+            later = rng.random() < spec.cycle_rate and idx < spec.modules - 1
+            if not later and idx == 0:
+                continue
+            imports.add(rng.randrange(idx + 1, spec.modules) if later else rng.randrange(idx))
+        source = module_source(idx, spec, sorted(imports), module_names, rng)
+        (root.joinpath(*placement[idx]) / f'm{idx}.py').write_text(source)
+    return root
@@ -2,19 +2,28 @@ from neo4j import AsyncGraphDatabase, AsyncResult
 from neo4j.exceptions import ClientError
 
 from svisitor import SVisitor
+from sources import package_source, REMOTE_PREFIXES
+from profiling import ScanProfile
+from cache import SummaryCache, QueryCache
+from bulk_export import write_neo4j_admin
+from stream import GraphStream
 from snode import SNodeType, SNode
 from sgraph import SEdgeType, SEdge, SGraph
 from logging_settings import logger
 
 import asyncio
+import json
 import os
 import logging
 from pathlib import Path
 import argparse
 from datetime import datetime
-import shutil
-import subprocess
+import tempfile
+import time
+import uuid
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Dict, Callable, List, Set, Tuple
 
 
 class Connector:
@@ -23,9 +32,12 @@ class Connector:
     # set user password with
     # alter user neo4j set password 'password';
     auth = ('neo4j', 'password')
+    # label of the single node holding the data version stamp
+    data_version_label = 'PygdbDataVersion'
 
-    def __init__(self, uri=None, auth=None, db_name=None):
-        self.driver = AsyncGraphDatabase.driver(
+    def __init__(self, uri=None, auth=None, db_name=None, driver=None):
+        # an already made driver, e.g. a stand-in for benchmarks, is used as is
+        self.driver = driver if driver is not None else AsyncGraphDatabase.driver(
             uri=uri or self.uri,
             auth=auth or self.auth,
         )
@@ -42,6 +54,29 @@ class Connector:
         await self.session.close()
         await self.driver.close()
 
+    async def write_data_version(self) -> str:
+        """
+        stamp the data as changed,
+        cached query results of older stamps are not used anymore
+        """
+        stamp = uuid.uuid4().hex
+        await self.driver.execute_query(
+            f'''
+            MERGE (version:{self.data_version_label})
+            SET version.stamp = $stamp, version.written = datetime()
+            ''',
+            parameters_={'stamp': stamp},
+            database_=self.db_name
+        )
+        return stamp
+
+    async def read_data_version(self) -> str | None:
+        records, _, _ = await self.driver.execute_query(
+            f'MATCH (version:{self.data_version_label}) RETURN version.stamp AS stamp',
+            database_=self.db_name
+        )
+        return records[0]['stamp'] if records else None
+
     @staticmethod
     async def create_node_transaction(tx, snode: SNode):
         snodetype = snode.snodetype.value
@@ -58,7 +93,8 @@ class Connector:
             '''
             WITH $li AS batch
             UNWIND batch AS node
-            MERGE (:Module {fullname: node.fullname, name: node.name, packageName: node.packageName}) 
+            MERGE (n:Module {fullname: node.fullname})
+            SET n.name = node.name, n.packageName = node.packageName
             ''',
             li=li
         )
@@ -69,7 +105,8 @@ class Connector:
             '''
             WITH $li AS batch
             UNWIND batch AS node
-            MERGE (:Package {fullname: node.fullname, name: node.name, packageName: node.packageName}) 
+            MERGE (n:Package {fullname: node.fullname})
+            SET n.name = node.name, n.packageName = node.packageName
             ''',
             li=li
         )
@@ -80,7 +117,8 @@ class Connector:
             '''
             WITH $li AS batch
             UNWIND batch AS node
-            MERGE (:Class {fullname: node.fullname, name: node.name, moduleName: node.moduleName, packageName: node.packageName, docstring: COALESCE(node.docstring, \'\')}) 
+            MERGE (n:Class {fullname: node.fullname})
+            SET n.name = node.name, n.moduleName = node.moduleName, n.packageName = node.packageName, n.docstring = COALESCE(node.docstring, \'\')
             ''',
             li=li
         )
@@ -91,7 +129,8 @@ class Connector:
             '''
             WITH $li AS batch
             UNWIND batch AS node
-            MERGE (:Function {fullname: node.fullname, name: node.name, moduleName: node.moduleName, packageName: node.packageName, docstring: COALESCE(node.docstring, \'\'), isAsync: COALESCE(node.isAsync, false)}) 
+            MERGE (n:Function {fullname: node.fullname})
+            SET n.name = node.name, n.moduleName = node.moduleName, n.packageName = node.packageName, n.docstring = COALESCE(node.docstring, \'\'), n.isAsync = COALESCE(node.isAsync, false)
             ''',
             li=li
         )
@@ -102,7 +141,8 @@ class Connector:
             '''
             WITH $li AS batch
             UNWIND batch AS node
-            MERGE (:Name {fullname: node.fullname, name: node.name, moduleName: node.moduleName, packageName: node.packageName, type: COALESCE(node.type, \'\')}) 
+            MERGE (n:Name {fullname: node.fullname})
+            SET n.name = node.name, n.moduleName = node.moduleName, n.packageName = node.packageName, n.type = COALESCE(node.type, \'\')
             ''',
             li=li
         )
@@ -132,25 +172,27 @@ class Connector:
         )
 
     @staticmethod
-    async def _batch_method_edge_generic(tx, sedgetype_str, data):
+    async def _batch_method_edge_generic(tx, sedgetype_str, data, first_label, second_label):
         await tx.run(
             f'''
             WITH $data AS batch
             UNWIND batch AS edge
-            MATCH (first {{fullname: edge.first}}), (second {{fullname: edge.second}})
-            MERGE (first)-[: {sedgetype_str}]->(second)
+            MATCH (first{first_label} {{fullname: edge.first}}), (second{second_label} {{fullname: edge.second}})
+            MERGE (first)-[rel: {sedgetype_str}]->(second)
+            SET rel.count = edge.count, rel.firstLine = edge.firstLine, rel.lastLine = edge.lastLine
             ''',
             data=data
         )
 
     @staticmethod
-    async def _batch_method_edge_anyimport(tx, sedgetype_str, data):
+    async def _batch_method_edge_anyimport(tx, sedgetype_str, data, first_label, second_label):
         await tx.run(
             f'''
             WITH $data AS batch
             UNWIND batch AS edge
-            MATCH (first {{fullname: edge.first}}), (second {{fullname: edge.second}})
-            MERGE (first)-[: {sedgetype_str} {{ alias: COALESCE(edge.alias, \'\') }}]->(second)
+            MATCH (first{first_label} {{fullname: edge.first}}), (second{second_label} {{fullname: edge.second}})
+            MERGE (first)-[rel: {sedgetype_str} {{ alias: COALESCE(edge.alias, \'\') }}]->(second)
+            SET rel.count = edge.count, rel.firstLine = edge.firstLine, rel.lastLine = edge.lastLine
             ''',
             data=data
         )
@@ -160,11 +202,89 @@ class Connector:
         SEdgeType.ImportsFrom: _batch_method_edge_anyimport,
     }
 
-    async def create_edges_batch(self, tx, sedgetype_str, data):
+    async def create_edges_batch(self, tx, sedgetype_str, data, first_snodetype_str=None, second_snodetype_str=None):
         """
-        note: data should also have attrs first (fullname of first node) and second
+        note: data should also have attrs first (fullname of first node) and second,
+        if node types are given for all edges of data, nodes are matched
+        through the fullname index of their label
         """
-        await self._batch_methods_edge_dict.get(SEdgeType.from_str(sedgetype_str), Connector._batch_method_edge_generic)(tx, sedgetype_str, data)
+        first_label = f':{SNodeType.from_str(first_snodetype_str).value}' if first_snodetype_str is not None else ''
+        second_label = f':{SNodeType.from_str(second_snodetype_str).value}' if second_snodetype_str is not None else ''
+        await self._batch_methods_edge_dict.get(SEdgeType.from_str(sedgetype_str), Connector._batch_method_edge_generic)(tx, sedgetype_str, data, first_label, second_label)
+
+    async def write_batches(self, batches: Iterator[Dict], nodes: bool, total: int, concurrency: int) -> None:
+        """
+        write batches of nodes or edges, given as keyword arguments
+        of create_nodes_batch or create_edges_batch,
+        at most concurrency transactions are in flight,
+        each on its own session from the driver's pool
+        """
+        unit = 'nodes' if nodes else 'edges'
+        done = 0
+        start_time = time.perf_counter()
+
+        async def worker():
+            nonlocal done
+            async with self.driver.session(database=self.db_name) as session:
+                # batches are shared, each worker takes the next one when free
+                for kwargs in batches:
+                    await session.execute_write(self.create_nodes_batch if nodes else self.create_edges_batch, **kwargs)
+                    done += len(kwargs['li'] if nodes else kwargs['data'])
+                    logger.info(f'{done}/{total} {unit} written ({done / (time.perf_counter() - start_time):.0f} {unit}/s).')
+
+        await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+        logger.info(f'Wrote {done} {unit} in {time.perf_counter() - start_time:.2f} seconds.')
+
+    async def write_queue(self, queue: asyncio.Queue, unwritten: Set[asyncio.Event], concurrency: int) -> None:
+        """
+        write batches from queue until each worker gets None,
+        items are (True, (snodetype, li), event set once written)
+        or (False, (sedgetype, first type, second type, data), events to wait for),
+        after an error the queue is still drained so that its producer is not blocked
+        """
+        done = {'nodes': 0, 'edges': 0}
+        errors: List[BaseException] = []
+        start_time = time.perf_counter()
+
+        async def worker():
+            async with self.driver.session(database=self.db_name) as session:
+                while (item := await queue.get()) is not None:
+                    nodes, batch, events = item
+                    if errors:
+                        continue
+                    try:
+                        if nodes:
+                            snodetype, li = batch
+                            await session.execute_write(self.create_nodes_batch, snodetype_str=snodetype.value, li=li)
+                            events.set()
+                            unwritten.discard(events)
+                            done['nodes'] += len(li)
+                        else:
+                            for written in events:
+                                await written.wait()
+                            sedgetype, first_type, second_type, data = batch
+                            await session.execute_write(
+                                self.create_edges_batch,
+                                sedgetype_str=sedgetype.value,
+                                data=data,
+                                first_snodetype_str=first_type.value,
+                                second_snodetype_str=second_type.value
+                            )
+                            done['edges'] += len(data)
+                    except Exception as e:
+                        errors.append(e)
+                        # edge batches waiting on this one must not wait forever
+                        for written in unwritten:
+                            written.set()
+                        continue
+
+                    elapsed = time.perf_counter() - start_time
+                    logger.info(f'{done["nodes"]} nodes and {done["edges"]} edges written ({(done["nodes"] + done["edges"]) / elapsed:.0f} per second).')
+
+        await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+        if errors:
+            raise errors[0]
+        logger.info(f'Wrote {done["nodes"]} nodes and {done["edges"]} edges in {time.perf_counter() - start_time:.2f} seconds.')
 
 
 async def clear(args, connector):
@@ -219,17 +339,80 @@ async def clear(args, connector):
             database_=connector.db_name
         )
 
+        await connector.write_data_version()
         print(f'Database {db_name} reset successfully.')
 
     except ClientError as e:
         print(f'Database could not be reset, error: {e}')
 
 
-async def add(args, connector):
+def read_manifest(path: str) -> List[Tuple[str, str]]:
     """
-    add new package
-    to database
+    (uri, relative path) of the packages in a manifest file,
+    one per line as `uri [relative path]`,
+    empty lines and lines starting with # are skipped
     """
+    packages = []
+    with open(path) as file:
+        for line in file:
+            fields = line.split()
+            if fields and not fields[0].startswith('#'):
+                packages.append((fields[0], fields[1] if len(fields) > 1 else '.'))
+    return packages
+
+
+def package_list(args) -> List[Tuple[str, str]]:
+    """
+    (uri, relative path) of the packages given to add
+    """
+    packages = [(uri, args.relative) for uri in args.uri or []]
+    if args.manifest is not None:
+        packages.extend(read_manifest(args.manifest))
+    return packages or [('test/', args.relative)]
+
+
+def scan_to_file(args, uri: str, relative: str, snapshot_path: Path) -> str:
+    """
+    scan one of several packages in a worker process,
+    its graph is saved for the process writing to the database
+    """
+    args = argparse.Namespace(**{
+        **{key: value for key, value in vars(args).items() if key != 'func'},
+        'uri': uri, 'relative': relative, 'jobs': 1, 'incremental': None,
+        'profile': None, 'profile_memory': False, 'cprofile': None, 'collapsed': None
+    })
+    try:
+        scan(args).sgraph.save(snapshot_path)
+    except Exception as e:
+        raise Exception(f'Failed to scan {uri}: {e}') from e
+    return uri
+
+
+def scan_profile(args) -> ScanProfile:
+    """
+    profile of a scan and the phase after it, modules are only timed and
+    memory only traced when a report is asked for
+    """
+    return ScanProfile(
+        trace_memory=args.profile_memory,
+        per_module=args.profile is not None,
+        cprofile=args.cprofile is not None,
+        sample_stacks=args.collapsed is not None,
+    )
+
+
+def save_profile(args, profile: ScanProfile, phase: str) -> None:
+    """
+    end the phase following the scan, e.g. ingest,
+    and save the reports asked for
+    """
+    record = profile.end_phase(phase)
+    logger.info(f'Finished {phase} in {record["wall"]:.2f} seconds ({profile.elapsed():.2f} seconds in total).')
+    profile.finish()
+    profile.save(args.profile, args.profile_top, args.cprofile, args.collapsed)
+
+
+def set_logging_level(args) -> None:
     logging_dict = {
         0: logging.CRITICAL,
         1: logging.ERROR,
@@ -239,73 +422,272 @@ async def add(args, connector):
     }
     logger.setLevel(logging_dict.get(args.logging_level))
 
-    cleanup = False
-    orig_loc = os.getcwd()
 
-    if all([not args.uri.startswith(_) for _ in ['http://', 'https://', 'git@']]):
-        os.chdir(args.uri)
-    else:
-        cleanup = True
-        try:
-            logger.info(f'Cloning {args.uri}...')
-            subprocess.check_call(['git', 'clone', args.uri])
-        except subprocess.CalledProcessError as e:
-            raise Exception(f'Failed to clone remote repository: {e}')
+def scan(
+        args,
+        sv: SVisitor | None = None,
+        on_module: Callable[[SNode], None] | None = None,
+        profile: ScanProfile | None = None
+) -> SVisitor:
+    """
+    scan package at args.uri with sv (a new SVisitor by default),
+    fetching it first if remote, phases are recorded in profile,
+    one made from args by default
+    """
+    set_logging_level(args)
+    state_path = Path(args.incremental).resolve() if args.incremental is not None else None
+
+    sv = SVisitor() if sv is None else sv
+    profile = scan_profile(args) if profile is None else profile
+    cache = SummaryCache() if not args.no_cache else None
+    with package_source(args.uri, args.relative, args.rev, args.exclude, not args.no_gitignore, args.list_threads) as source:
+        if args.uri.startswith(REMOTE_PREFIXES):
+            profile.end_phase('fetch')
+        sv.scan_package(root_dir=source, jobs=args.jobs, state_path=state_path, cache=cache, low_memory=args.low_memory, on_module=on_module, profile=profile)
+    return sv
+
+
+def scanned_graph(args, profile: ScanProfile) -> SGraph:
+    """
+    graph of the package, read from
+    args.snapshot instead if given
+    """
+    if args.snapshot is None:
+        return scan(args, profile=profile).sgraph
 
-        if args.uri.endswith('/'):
-            args.uri = args.uri[:-1]
-        repo_name = args.uri.split('/')[-1]
-        if repo_name.endswith('.git'):
-            repo_name = repo_name[:-len('.git')]
-        os.chdir(repo_name)
-        cleanup_path = os.getcwd()
+    set_logging_level(args)
+    sgraph = SGraph.load(args.snapshot)
+    profile.end_phase('load')
+    logger.info(f'Loaded {len(sgraph.snodes)} nodes and {len(sgraph.sedges)} edges from {args.snapshot}.')
+    return sgraph
 
-        rel_path = Path(args.relative).resolve()
-        os.chdir(rel_path)
 
-    sv = SVisitor()
-    sv.scan_package(root_dir=os.getcwd())
+async def add(args, connector):
+    """
+    add new packages
+    to database
+    """
+    packages = package_list(args)
+    try:
+        if len(packages) > 1:
+            await add_many(args, connector, packages)
+            return
+
+        args.uri, args.relative = packages[0]
+        if args.snapshot is None and not args.no_stream:
+            await scan_and_write(args, connector)
+            return
+
+        profile = scan_profile(args)
+        await write_sgraph(args, connector, scanned_graph(args, profile))
+        save_profile(args, profile, 'ingest')
+    finally:
+        # also after a failure, part of the data may have been written,
+        # a failed stamp is only logged so that it does not hide the error of the ingest
+        try:
+            await connector.write_data_version()
+        except Exception as e:
+            logger.error(f'Could not write the data version stamp, cached query results may be stale: {e}')
 
-    if cleanup:
-        shutil.rmtree(cleanup_path)
-        logger.info('Cleanup complete.')
 
+async def add_many(args, connector, packages: List[Tuple[str, str]]):
+    """
+    scan packages in a pool of worker processes, each graph is written
+    as soon as its scan is done while the others are still being scanned
+    """
+    loop = asyncio.get_running_loop()
+    with tempfile.TemporaryDirectory(prefix='pygdb-') as snapshot_dir, ProcessPoolExecutor(max_workers=args.parallel) as executor:
+        async def scan_one(idx: int, uri: str, relative: str) -> Tuple[str, Path]:
+            snapshot_path = Path(snapshot_dir) / f'{idx}.snap'
+            await loop.run_in_executor(executor, scan_to_file, args, uri, relative, snapshot_path)
+            return uri, snapshot_path
+
+        logger.info(f'Adding {len(packages)} packages, {args.parallel} scanned at a time.')
+        if args.incremental is not None:
+            logger.warning('A scan state is kept for a single package, --incremental is ignored.')
+        if any(path is not None for path in [args.profile, args.cprofile, args.collapsed]):
+            logger.warning('Profiles are made for a single package, --profile, --cprofile and --collapsed are ignored.')
+        failed = []
+        for scanned in asyncio.as_completed([scan_one(idx, uri, relative) for idx, (uri, relative) in enumerate(packages)]):
+            try:
+                uri, snapshot_path = await scanned
+            except Exception as e:
+                logger.error(str(e))
+                failed.append(e)
+                continue
+
+            sgraph = SGraph.load(snapshot_path)
+            os.remove(snapshot_path)
+            await write_sgraph(args, connector, sgraph)
+            logger.info(f'Added {uri}.')
+
+    logger.info(f'Added {len(packages) - len(failed)}/{len(packages)} packages.')
+
+
+async def write_sgraph(args, connector, sgraph: SGraph):
+    """
+    write all nodes of sgraph,
+    then all of its edges
+    """
     logger.info('Starting transactions.')
-    # for snode in sv.sgraph.snodes.values():
+    # for snode in sgraph.snodes.values():
     #     connector.session.execute_write(Connector.create_node_transaction, snode)
 
-    for label in [_.value for _ in SNodeType]:
-        logger.info(f'Adding nodes with {label=}')
-        await connector.session.execute_write(
-            connector.create_nodes_batch,
-            snodetype_str=label,
-            li=[vars(snode) for fullname, snode in sv.sgraph.snodes.items() if snode.snodetype.value == label]
-        )
+    # labels are written in parallel, all nodes before any edge
+    await connector.write_batches(
+        ({'snodetype_str': snodetype.value, 'li': li} for snodetype, li in sgraph.node_batches(args.batch_size)),
+        nodes=True,
+        total=len(sgraph.snodes),
+        concurrency=args.concurrency
+    )
 
     logger.info('Nodes done.')
-    # for sedge in sv.sgraph.sedges:
+    # for sedge in sgraph.sedges:
     #     connector.session.execute_write(Connector.create_edge_transction, sedge)
 
-    for _type in [_.value for _ in SEdgeType]:
-        logger.info(f'Adding edges with {_type=}')
-        await connector.session.execute_write(
-            connector.create_edges_batch,
-            sedgetype_str=_type,
-            data=[
-                {**vars(sedge), **{'first': sedge.first.fullname, 'second': sedge.second.fullname}}
-                for sedge in sv.sgraph.sedges if sedge.sedgetype.value == _type
-            ]
-        )
+    await connector.write_batches(
+        (
+            {'sedgetype_str': sedgetype.value, 'data': data, 'first_snodetype_str': first_type.value, 'second_snodetype_str': second_type.value}
+            for sedgetype, first_type, second_type, data in sgraph.edge_batches(args.batch_size)
+        ),
+        nodes=False,
+        total=len(sgraph.sedges),
+        concurrency=args.concurrency
+    )
 
     logger.info('Edges done.')
     logger.info('Transactions complete.')
 
 
+async def scan_and_write(args, connector):
+    """
+    scan package in a worker thread while its nodes and edges are written,
+    batches are handed over as modules finish their third pass
+    through a bounded queue, so the scan waits whenever writers fall behind
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=2 * max(args.concurrency, 1))
+
+    # node batches not written yet, edge batches wait for those queued before them
+    unwritten: Set[asyncio.Event] = set()
+
+    async def enqueue(nodes: bool, batch) -> None:
+        if nodes:
+            written = asyncio.Event()
+            unwritten.add(written)
+            await queue.put((nodes, batch, written))
+        else:
+            await queue.put((nodes, batch, list(unwritten)))
+
+    def hand_over(batches) -> None:
+        for nodes, batch in batches:
+            asyncio.run_coroutine_threadsafe(enqueue(nodes, batch), loop).result()
+
+    def produce() -> None:
+        try:
+            sv = SVisitor()
+            stream = GraphStream(sv.sgraph, args.batch_size)
+            sv.on_attrs = stream.attrs_added
+            scan(args, sv, on_module=lambda module_snode: hand_over(stream.module_done(module_snode)), profile=profile)
+            hand_over(stream.finish())
+        finally:
+            for _ in range(max(args.concurrency, 1)):
+                asyncio.run_coroutine_threadsafe(queue.put(None), loop).result()
+
+    # ingest is recorded from the end of the scan until the last batch is written
+    profile = scan_profile(args)
+    logger.info('Starting transactions while scanning.')
+    producer = loop.run_in_executor(None, produce)
+    await asyncio.gather(connector.write_queue(queue, unwritten, args.concurrency), producer)
+    logger.info('Transactions complete.')
+    save_profile(args, profile, 'ingest')
+
+
+def export(args):
+    """
+    scan package and write it to files
+    for offline import
+    """
+    out_dir = Path(args.output_dir).resolve()
+    profile = scan_profile(args)
+    sgraph = scanned_graph(args, profile)
+    import_args = write_neo4j_admin(sgraph, out_dir, compress=args.gzip)
+    save_profile(args, profile, 'export')
+    logger.info(f'Import with: cd {out_dir} && neo4j-admin database import full <database> {" ".join(import_args)}')
+
+
+def snapshot(args):
+    """
+    scan package and save its graph,
+    to be read by add and export with --snapshot
+    """
+    out_path = Path(args.output).resolve()
+    sv = scan(args)
+    sv.sgraph.save(out_path)
+    save_profile(args, sv.profile, 'save')
+
+
+def query_parameters(args) -> Dict:
+    """
+    values of --param are read as JSON, e.g. 10 or '["a", "b"]',
+    anything else is passed as a string
+    """
+    parameters = {}
+    for name, value in args.param:
+        try:
+            parameters[name] = json.loads(value)
+        except json.JSONDecodeError:
+            parameters[name] = value
+    return parameters
+
+
+def query_records(query_graph, skip_label: str) -> Dict[str, List[Tuple]]:
+    """
+    nodes as (label, fullname, name), relationships as (type, first fullname, second fullname),
+    nodes with skip_label (the data version stamp) are left out
+    """
+    return {
+        'nodes': [
+            (list(node.labels)[0], node.get('fullname'), node.get('name'))
+            for node in query_graph.nodes
+            if skip_label not in node.labels
+        ],
+        'edges': [
+            (edge.type, edge.start_node.get('fullname'), edge.end_node.get('fullname'))
+            for edge in query_graph.relationships
+        ],
+    }
+
+
+def records_graph(records: Dict[str, List[Tuple]]) -> SGraph:
+    sgraph = SGraph()
+
+    for label, fullname, name in records['nodes']:
+        new_snode = SNode(
+            snodetype=SNodeType.from_str(label),
+            fullname=fullname,
+            name=name
+        )
+
+        sgraph.add_snodes(new_snode)
+
+    for label, first_fullname, second_fullname in records['edges']:
+        new_sedge = SEdge(
+            (sgraph.snodes.get(first_fullname), sgraph.snodes.get(second_fullname)),
+            SEdgeType.from_str(label)
+        )
+
+        sgraph.add_sedges(new_sedge)
+
+    return sgraph
+
+
 async def query(args, connector):
     """
     execute a query and visualize
     with Graphviz
     potentially slow/vulnerable
+    results are cached until add or clear change the data, unless --refresh is given
     """
     os.chdir(Path(__file__).resolve().parent)
     if args.output is None:
@@ -330,8 +712,24 @@ async def query(args, connector):
 
         os.chdir(output_folder)
 
+    output_path = Path(output_folder) / Path(output_filename)
+    parameters = query_parameters(args)
+    cache = QueryCache()
+    stamp = await connector.read_data_version()
+    key = (args.query_string, parameters, connector.db_name, stamp)
+    if stamp is None:
+        logger.info('The database has no data version stamp yet, written by add and clear, the result is not cached.')
+    elif not args.refresh and (cached := cache.get(key)) is not None:
+        # Graphviz source and image
+        for suffix, content in cached['rendered'].items():
+            Path(f'{output_path}{suffix}').write_bytes(content)
+        logger.info(f'Used the cached result of {len(cached["records"]["nodes"])} nodes and {len(cached["records"]["edges"])} edges.')
+        print('Done.')
+        return
+
     query_graph = await connector.driver.execute_query(
         args.query_string,
+        parameters_=parameters,
         database_=connector.db_name,
         result_transformer_=AsyncResult.graph
     )
@@ -339,30 +737,13 @@ async def query(args, connector):
     # if (result_size := len(query_graph.nodes)) > 500:
     #     raise ValueError(f'Query result too large ({result_size}), will not visualize.')
 
-    sgraph = SGraph()
-
-    for node in query_graph.nodes:
-        label = list(node.labels)[0]
-        new_snode = SNode(
-            snodetype=SNodeType.from_str(label),
-            fullname=node.get('fullname'),
-            name=node.get('name')
-        )
-
-        sgraph.add_snodes(new_snode)
-
-    for edge in query_graph.relationships:
-        label = edge.type
-        first_snode = sgraph.snodes.get(edge.start_node.get('fullname'))
-        second_snode = sgraph.snodes.get(edge.end_node.get('fullname'))
-        new_sedge = SEdge(
-            (first_snode, second_snode),
-            SEdgeType.from_str(label)
-        )
-
-        sgraph.add_sedges(new_sedge)
+    records = query_records(query_graph, connector.data_version_label)
+    records_graph(records).visualize(output_path, im_format='png')
 
-    sgraph.visualize(Path(output_folder) / Path(output_filename), im_format='png')
+    if stamp is not None:
+        rendered = {suffix: Path(f'{output_path}{suffix}').read_bytes() for suffix in ['', '.png']}
+        cache.put(key, {'records': records, 'rendered': rendered})
+        cache.evict()
     print('Done.')
 
 
@@ -404,25 +785,88 @@ if __name__ == '__main__':
 
     subparsers = parser.add_subparsers()
 
-    # subcommands are clear, add, query
+    # subcommands are clear, add, export, scan, query
     clear_parser = subparsers.add_parser('clear', aliases=['c', 'create', 'r', 'reset'], help='reset contents of the database')
 
-    add_parser = subparsers.add_parser('add', aliases=['a'], help='add new package to database')
-    add_parser.add_argument(
-        '-u', '--uri',
+    # options for scanning a package, shared by add, export and scan,
+    # which add --uri themselves since add takes several packages
+    scan_parser = argparse.ArgumentParser(add_help=False)
+    scan_parser.add_argument(
+        '-r', '--relative',
         type=str,
-        default='test/',
-        help='URI of package'
+        default='.',
+        help='relative path of the package within uri, e.g. "src"'
     )
 
-    add_parser.add_argument(
-        '-r', '--relative',
+    scan_parser.add_argument(
+        '--rev',
         type=str,
-        default='.',
-        help='relative path within remote uri, e.g. "src"'
+        default=None,
+        help='git revision to read the package from without a checkout, '
+             'remote URIs and bare repositories are always read from git (at HEAD by default)'
     )
 
-    add_parser.add_argument(
+    scan_parser.add_argument(
+        '--exclude',
+        type=str,
+        action='append',
+        default=[],
+        metavar='PATTERN',
+        help='skip files and directories matching this .gitignore pattern, relative to the package, can be repeated'
+    )
+
+    scan_parser.add_argument(
+        '--no-gitignore',
+        action='store_true',
+        help='scan files ignored by the .gitignore files of the repository'
+    )
+
+    scan_parser.add_argument(
+        '--list-threads',
+        type=int,
+        default=4,
+        help='number of threads listing directories'
+    )
+
+    profile_group = scan_parser.add_argument_group('profiling')
+    profile_group.add_argument(
+        '--profile',
+        type=str,
+        default=None,
+        metavar='REPORT',
+        help='write a JSON report of the wall time, CPU time and memory of each phase and of the slowest modules'
+    )
+
+    profile_group.add_argument(
+        '--profile-top',
+        type=int,
+        default=10,
+        help='number of slowest modules in the report'
+    )
+
+    profile_group.add_argument(
+        '--profile-memory',
+        action='store_true',
+        help='trace allocations of each phase with tracemalloc, slows the scan down'
+    )
+
+    profile_group.add_argument(
+        '--cprofile',
+        type=str,
+        default=None,
+        metavar='PATH',
+        help='dump cProfile statistics of the scan, to be read with pstats'
+    )
+
+    profile_group.add_argument(
+        '--collapsed',
+        type=str,
+        default=None,
+        metavar='PATH',
+        help='write sampled stacks of the scan in collapsed format, for flame graphs'
+    )
+
+    scan_parser.add_argument(
         '-l', '--logging-level',
         type=int,
         choices=range(5),
@@ -430,6 +874,131 @@ if __name__ == '__main__':
         help='logging level (critical=0, debug=4)'
     )
 
+    scan_parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help='number of worker processes for parsing modules'
+    )
+
+    scan_parser.add_argument(
+        '-i', '--incremental',
+        type=str,
+        required=False,
+        help='scan state file, modules unchanged since the last scan with it are not analyzed again'
+    )
+
+    scan_parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='do not use the cache of parsed modules'
+    )
+
+    scan_parser.add_argument(
+        '--low-memory',
+        action='store_true',
+        help='read sources from disk when needed and drop syntax trees after use'
+    )
+
+    add_parser = subparsers.add_parser('add', aliases=['a'], parents=[scan_parser], help='add new packages to database')
+    add_parser.add_argument(
+        '-u', '--uri',
+        type=str,
+        nargs='+',
+        help='URIs of packages, test/ if neither this nor --manifest is given'
+    )
+
+    add_parser.add_argument(
+        '-m', '--manifest',
+        type=str,
+        required=False,
+        help='file with the URI of a package on each line, optionally followed by its relative path'
+    )
+
+    add_parser.add_argument(
+        '-p', '--parallel',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='number of packages scanned at the same time when adding several'
+    )
+
+    add_parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=5000,
+        help='number of nodes or edges written per transaction'
+    )
+
+    add_parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=4,
+        help='maximum number of write transactions in flight'
+    )
+
+    add_parser.add_argument(
+        '--no-stream',
+        action='store_true',
+        help='write nodes and edges only after the whole package is scanned'
+    )
+
+    add_parser.add_argument(
+        '--snapshot',
+        type=str,
+        required=False,
+        help='read the graph from a snapshot saved by scan instead of scanning the package'
+    )
+
+    export_parser = subparsers.add_parser('export', aliases=['e'], parents=[scan_parser], help='scan package and write files for offline import')
+    export_parser.add_argument(
+        '-u', '--uri',
+        type=str,
+        default='test/',
+        help='URI of package'
+    )
+
+    export_parser.add_argument(
+        'output_dir',
+        type=str,
+        help='directory for the exported files'
+    )
+
+    export_parser.add_argument(
+        '-f', '--format',
+        type=str,
+        choices=['neo4j-admin'],
+        default='neo4j-admin',
+        help='format of the exported files, neo4j-admin writes CSV files for neo4j-admin database import'
+    )
+
+    export_parser.add_argument(
+        '--gzip',
+        action='store_true',
+        help='compress data files with gzip'
+    )
+
+    export_parser.add_argument(
+        '--snapshot',
+        type=str,
+        required=False,
+        help='read the graph from a snapshot saved by scan instead of scanning the package'
+    )
+
+    snapshot_parser = subparsers.add_parser('scan', parents=[scan_parser], help='scan package and save a snapshot of its graph')
+    snapshot_parser.add_argument(
+        '-u', '--uri',
+        type=str,
+        default='test/',
+        help='URI of package'
+    )
+
+    snapshot_parser.add_argument(
+        '-o', '--output',
+        type=str,
+        required=True,
+        help='snapshot file, e.g. graph.snap'
+    )
+
     query_parser = subparsers.add_parser('query', aliases=['q'], help='query the database and visualize with graphviz')
     query_parser.add_argument(
         '-q', '--query-string',
@@ -445,13 +1014,35 @@ if __name__ == '__main__':
         help='name of output png file'
     )
 
+    query_parser.add_argument(
+        '-p', '--param',
+        type=str,
+        nargs=2,
+        action='append',
+        default=[],
+        metavar=('NAME', 'VALUE'),
+        help='query parameter, e.g. -p name "func" for $name, values are read as JSON if they parse, can be repeated'
+    )
+
+    query_parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='execute the query even if its result is cached, the new result is cached'
+    )
+
     test_parser = subparsers.add_parser('test', aliases=['t'], help='test connection')
 
     add_parser.set_defaults(func=add)
+    export_parser.set_defaults(func=export, offline=True)
+    snapshot_parser.set_defaults(func=snapshot, offline=True)
     query_parser.set_defaults(func=query)
     clear_parser.set_defaults(func=clear)
     test_parser.set_defaults(func=test)
 
     args = parser.parse_args()
 
-    asyncio.run(async_wrapper(args))
+    if getattr(args, 'offline', False):
+        # no database needed
+        args.func(args)
+    else:
+        asyncio.run(async_wrapper(args))
@@ -0,0 +1,454 @@
+"""
+symbol tables computed from an AST,
+so that modules do not have to be compiled twice
+(once by symtable and once by ast.parse)
+
+mirrors the traversal of CPython's symtable.c closely enough
+that summaries are equal to those made from symtable.symtable
+"""
+import ast
+import sys
+from typing import List, Dict, Tuple, Callable, Union
+
+# versions for which the summaries were checked against symtable
+SUPPORTED_VERSIONS = ((3, 10), (3, 13))
+
+# symbol flags, cf. Include/internal/pycore_symtable.h
+DEF_GLOBAL = 1
+DEF_LOCAL = 2
+DEF_PARAM = 4
+DEF_NONLOCAL = 8
+USE = 16
+DEF_IMPORT = 128
+DEF_BOUND = DEF_LOCAL | DEF_PARAM | DEF_IMPORT
+
+# decorators are visited before annotations and bases since 3.12
+DECORATORS_FIRST = sys.version_info >= (3, 12)
+# symtable visited the else clause of try statements before the handlers until 3.13
+ELSE_BEFORE_HANDLERS = sys.version_info < (3, 13)
+# PEP 709
+INLINE_COMPREHENSIONS = sys.version_info >= (3, 12)
+# block types as reported by symtable.SymbolTable.get_type
+TYPE_PARAMETERS = 'type parameters' if sys.version_info >= (3, 13) else 'type parameter'
+TYPE_VARIABLE = 'type variable' if sys.version_info >= (3, 13) else 'TypeVar bound'
+
+COMPREHENSION_NAMES = {
+    ast.GeneratorExp: 'genexpr',
+    ast.ListComp: 'listcomp',
+    ast.SetComp: 'setcomp',
+    ast.DictComp: 'dictcomp',
+}
+
+
+def is_supported() -> bool:
+    return SUPPORTED_VERSIONS[0] <= sys.version_info[:2] <= SUPPORTED_VERSIONS[1]
+
+
+def mangle(private: str | None, name: str) -> str:
+    """
+    private name mangling, as in _Py_Mangle
+    """
+    if private is None or not name.startswith('__') or name.endswith('__') or '.' in name:
+        return name
+    stripped = private.lstrip('_')
+    if not stripped:
+        return name
+    return '_' + stripped + name
+
+
+class Block:
+    """
+    scope in the symbol table,
+    analogous to symtable.SymbolTable
+    """
+    def __init__(self, name: str, block_type: str, parent: Union['Block', None] = None, private: str | None = None):
+        self.name = name
+        self.type = block_type
+        self.parent = parent
+        self.private = private
+
+        # {mangled name: flags}, in order of first occurrence
+        self.symbols: Dict[str, int] = {}
+        self.children: List[Block] = []
+
+        self.comprehension = False
+        self.generator = False
+        self.can_see_class_scope = False
+
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def module(self) -> 'Block':
+        block = self
+        while block.parent is not None:
+            block = block.parent
+        return block
+
+    def add(self, name: str, flag: int) -> None:
+        name = mangle(self.private, name)
+        self.symbols[name] = self.symbols.get(name, 0) | flag
+        if flag & DEF_GLOBAL and self.parent is not None:
+            # global declarations are also recorded in the module
+            module = self.module
+            module.symbols[name] = module.symbols.get(name, 0) | flag
+
+    def is_local(self, flags: int) -> bool:
+        if self.type == 'module':
+            return bool(flags & DEF_BOUND)
+        return bool(flags & DEF_BOUND) and not flags & (DEF_GLOBAL | DEF_NONLOCAL)
+
+    def summary(self) -> Tuple[List[str], List[Tuple[str, str, Tuple]]]:
+        """
+        same form as svisitor.summarize_symbols
+        """
+        names = [name for name, flags in self.symbols.items() if self.is_local(flags) and not flags & DEF_IMPORT]
+        children = [(child.name, child.type, child.summary()) for child in self.children]
+        return names, children
+
+
+# a step is either a node to visit in a block or a function returning new steps
+Step = Union[Tuple[ast.AST, Block], Callable[[], List]]
+
+
+# fields holding child nodes, in reverse order so they are popped in order
+CHILD_FIELDS: Dict[type, Tuple[str, ...]] = {}
+# fields that never hold nodes with symbols
+LEAF_FIELDS = {'ctx', 'op', 'ops', 'attr', 'arg', 'conversion', 'kwd_attrs', 'type_comment', 'type_ignores'}
+
+
+def child_fields(node_type: type) -> Tuple[str, ...]:
+    if node_type in (ast.Constant, ast.MatchSingleton):
+        return ()
+    return tuple(reversed([field for field in node_type._fields if field not in LEAF_FIELDS]))
+
+
+def has_future_annotations(tree: ast.Module) -> bool:
+    for idx, statement in enumerate(tree.body):
+        if idx == 0 and isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Constant) and isinstance(statement.value.value, str):
+            # docstring
+            continue
+        if not isinstance(statement, ast.ImportFrom) or statement.module != '__future__':
+            return False
+        if any(alias.name == 'annotations' for alias in statement.names):
+            return True
+    return False
+
+
+def ast_symbols(tree: ast.Module) -> Tuple[List[str], List[Tuple[str, str, Tuple]]]:
+    """
+    summary of the symbol table of a module,
+    equal to summarize_symbols(symtable.symtable(...))
+    """
+    future_annotations = has_future_annotations(tree)
+    top = Block('top', 'module')
+
+    def nodes(node_list, block) -> List[Step]:
+        return [(node, block) for node in node_list if node is not None]
+
+    def annotation_steps(arguments: ast.arguments, returns, block) -> List[Step]:
+        if future_annotations:
+            return []
+        args = arguments.posonlyargs + arguments.args + [arguments.vararg, arguments.kwarg] + arguments.kwonlyargs
+        return nodes([arg.annotation for arg in args if arg is not None] + [returns], block)
+
+    def parameter_steps(arguments: ast.arguments, block) -> List[Step]:
+        args = arguments.posonlyargs + arguments.args + arguments.kwonlyargs + [arguments.vararg, arguments.kwarg]
+        return [add_step(block, arg.arg, DEF_PARAM) for arg in args if arg is not None]
+
+    def add_step(block: Block, name: str, flag: int) -> Callable[[], List]:
+        def step():
+            block.add(name, flag)
+            return []
+        return step
+
+    def new_block_step(name: str, block_type: str, parent: Block, body: Callable[[Block], List[Step]], private=None, **attrs):
+        def step():
+            block = Block(name, block_type, parent, private if private is not None else parent.private)
+            for key, value in attrs.items():
+                setattr(block, key, value)
+            return body(block)
+        return step
+
+    def type_param_steps(type_params, block) -> List[Step]:
+        steps = []
+        for type_param in type_params:
+            steps.append(add_step(block, type_param.name, DEF_LOCAL))
+            if getattr(type_param, 'bound', None) is not None:
+                steps.append(new_block_step(type_param.name, TYPE_VARIABLE, block, lambda b, tp=type_param: [(tp.bound, b)]))
+            if getattr(type_param, 'default_value', None) is not None:
+                steps.append(new_block_step(type_param.name, TYPE_VARIABLE, block, lambda b, tp=type_param: [(tp.default_value, b)]))
+        return steps
+
+    def type_param_block_step(name, parent, kind, body: Callable[[Block], List[Step]], private=None, has_defaults=False, has_kwdefaults=False):
+        def enter(block: Block) -> List[Step]:
+            if parent.type == 'class':
+                block.can_see_class_scope = True
+                block.add('__classdict__', USE)
+            if kind is ast.ClassDef:
+                block.add('.type_params', DEF_LOCAL)
+                block.add('.type_params', USE)
+                block.add('.generic_base', DEF_LOCAL)
+                block.add('.generic_base', USE)
+            if has_defaults:
+                block.add('.defaults', DEF_PARAM)
+            if has_kwdefaults:
+                block.add('.kwdefaults', DEF_PARAM)
+            return body(block)
+        return new_block_step(name, TYPE_PARAMETERS, parent, enter, private=private)
+
+    def visit_function(node: ast.FunctionDef | ast.AsyncFunctionDef | ast.Lambda, block: Block) -> List[Step]:
+        arguments = node.args
+        steps = nodes(arguments.defaults + arguments.kw_defaults, block)
+
+        def function_body(function_block: Block) -> List[Step]:
+            body = [node.body] if isinstance(node, ast.Lambda) else node.body
+            return parameter_steps(arguments, function_block) + nodes(body, function_block)
+
+        if isinstance(node, ast.Lambda):
+            return steps + [new_block_step('lambda', 'function', block, function_body)]
+
+        block.add(node.name, DEF_LOCAL)
+        type_params = getattr(node, 'type_params', None)
+        if DECORATORS_FIRST:
+            steps += nodes(node.decorator_list, block)
+            if type_params:
+                def generic_body(type_param_block: Block) -> List[Step]:
+                    return (
+                        type_param_steps(type_params, type_param_block)
+                        + annotation_steps(arguments, node.returns, type_param_block)
+                        + [new_block_step(node.name, 'function', type_param_block, function_body)]
+                    )
+                has_kwdefaults = any(default is not None for default in arguments.kw_defaults)
+                return steps + [type_param_block_step(node.name, block, type(node), generic_body, has_defaults=True, has_kwdefaults=has_kwdefaults)]
+            steps += annotation_steps(arguments, node.returns, block)
+        else:
+            steps += annotation_steps(arguments, node.returns, block) + nodes(node.decorator_list, block)
+        return steps + [new_block_step(node.name, 'function', block, function_body)]
+
+    def visit_class(node: ast.ClassDef, block: Block) -> List[Step]:
+        block.add(node.name, DEF_LOCAL)
+        type_params = getattr(node, 'type_params', None)
+
+        def class_body(class_block: Block) -> List[Step]:
+            if type_params:
+                class_block.add('__type_params__', DEF_LOCAL)
+                class_block.add('.type_params', USE)
+            return nodes(node.body, class_block)
+
+        def bases_and_body(bases_block: Block) -> List[Step]:
+            return (
+                nodes(node.bases + [keyword.value for keyword in node.keywords], bases_block)
+                + [new_block_step(node.name, 'class', bases_block, class_body, private=node.name)]
+            )
+
+        if not DECORATORS_FIRST:
+            return bases_and_body(block)[:-1] + nodes(node.decorator_list, block) + bases_and_body(block)[-1:]
+
+        steps = nodes(node.decorator_list, block)
+        if type_params:
+            def generic_body(type_param_block: Block) -> List[Step]:
+                return type_param_steps(type_params, type_param_block) + bases_and_body(type_param_block)
+            return steps + [type_param_block_step(node.name, block, ast.ClassDef, generic_body, private=node.name)]
+        return steps + bases_and_body(block)
+
+    def visit_type_alias(node, block: Block) -> List[Step]:
+        name = node.name.id
+
+        def alias_body(alias_block: Block) -> List[Step]:
+            if alias_block.parent.type == 'class':
+                alias_block.can_see_class_scope = True
+                alias_block.add('__classdict__', USE)
+            return [(node.value, alias_block)]
+
+        def generic_body(type_param_block: Block) -> List[Step]:
+            return type_param_steps(node.type_params, type_param_block) + [new_block_step(name, 'type alias', type_param_block, alias_body)]
+
+        if node.type_params:
+            return [(node.name, block), type_param_block_step(name, block, type(node), generic_body)]
+        return [(node.name, block), new_block_step(name, 'type alias', block, alias_body)]
+
+    def visit_comprehension(node, block: Block) -> List[Step]:
+        outermost, *generators = node.generators
+
+        def comprehension_body(comprehension_block: Block) -> List[Step]:
+            comprehension_block.add('.0', DEF_PARAM)
+            steps = [(outermost.target, comprehension_block)] + nodes(outermost.ifs, comprehension_block)
+            for generator in generators:
+                steps += [(generator.target, comprehension_block), (generator.iter, comprehension_block)] + nodes(generator.ifs, comprehension_block)
+            if isinstance(node, ast.DictComp):
+                return steps + [(node.value, comprehension_block), (node.key, comprehension_block)]
+            return steps + [(node.elt, comprehension_block)]
+
+        return [
+            (outermost.iter, block),
+            new_block_step(
+                COMPREHENSION_NAMES[type(node)], 'function', block, comprehension_body,
+                comprehension=True, generator=isinstance(node, ast.GeneratorExp)
+            )
+        ]
+
+    def visit_namedexpr(node: ast.NamedExpr, block: Block) -> List[Step]:
+        if block.comprehension:
+            # the target is bound in the enclosing function or module
+            name = node.target.id
+            enclosing = block.parent
+            while enclosing is not None and enclosing.comprehension:
+                enclosing = enclosing.parent
+            if enclosing is not None and enclosing.type == 'function':
+                if enclosing.symbols.get(mangle(block.private, name), 0) & DEF_GLOBAL:
+                    block.add(name, DEF_GLOBAL)
+                else:
+                    block.add(name, DEF_NONLOCAL)
+                enclosing.symbols[mangle(block.private, name)] = enclosing.symbols.get(mangle(block.private, name), 0) | DEF_LOCAL
+            elif enclosing is not None and enclosing.type == 'module':
+                block.add(name, DEF_GLOBAL)
+        return [(node.value, block), (node.target, block)]
+
+    def visit_import(node: ast.Import | ast.ImportFrom, block: Block) -> List[Step]:
+        for alias in node.names:
+            if alias.name != '*':
+                block.add(alias.asname or alias.name.split('.')[0], DEF_IMPORT)
+        return []
+
+    def visit_annassign(node: ast.AnnAssign, block: Block) -> List[Step]:
+        steps = []
+        if isinstance(node.target, ast.Name):
+            if node.simple:
+                block.add(node.target.id, DEF_LOCAL)
+            elif node.value is not None:
+                block.add(node.target.id, DEF_LOCAL)
+        else:
+            steps.append((node.target, block))
+        if not future_annotations:
+            steps.append((node.annotation, block))
+        return steps + nodes([node.value], block)
+
+    def visit_excepthandler(node: ast.ExceptHandler, block: Block) -> List[Step]:
+        steps = nodes([node.type], block)
+        if node.name is not None:
+            steps.append(add_step(block, node.name, DEF_LOCAL))
+        return steps + nodes(node.body, block)
+
+    def visit_try(node: ast.Try, block: Block) -> List[Step]:
+        if ELSE_BEFORE_HANDLERS:
+            return nodes(node.body + node.orelse + node.handlers + node.finalbody, block)
+        return nodes(node.body + node.handlers + node.orelse + node.finalbody, block)
+
+    def visit_global(node: ast.Global, block: Block) -> List[Step]:
+        for name in node.names:
+            block.add(name, DEF_GLOBAL)
+        return []
+
+    def visit_nonlocal(node: ast.Nonlocal, block: Block) -> List[Step]:
+        for name in node.names:
+            block.add(name, DEF_NONLOCAL)
+        return []
+
+    def visit_matchas(node: ast.MatchAs, block: Block) -> List[Step]:
+        steps = nodes([node.pattern], block)
+        if node.name is not None:
+            steps.append(add_step(block, node.name, DEF_LOCAL))
+        return steps
+
+    def visit_matchstar(node: ast.MatchStar, block: Block) -> List[Step]:
+        if node.name is not None:
+            block.add(node.name, DEF_LOCAL)
+        return []
+
+    def visit_matchmapping(node: ast.MatchMapping, block: Block) -> List[Step]:
+        steps = nodes(node.keys + node.patterns, block)
+        if node.rest is not None:
+            steps.append(add_step(block, node.rest, DEF_LOCAL))
+        return steps
+
+    visitors = {
+        ast.FunctionDef: visit_function,
+        ast.AsyncFunctionDef: visit_function,
+        ast.Lambda: visit_function,
+        ast.ClassDef: visit_class,
+        ast.GeneratorExp: visit_comprehension,
+        ast.ListComp: visit_comprehension,
+        ast.SetComp: visit_comprehension,
+        ast.DictComp: visit_comprehension,
+        ast.NamedExpr: visit_namedexpr,
+        ast.Import: visit_import,
+        ast.ImportFrom: visit_import,
+        ast.AnnAssign: visit_annassign,
+        ast.ExceptHandler: visit_excepthandler,
+        ast.Try: visit_try,
+        ast.Global: visit_global,
+        ast.Nonlocal: visit_nonlocal,
+        ast.MatchAs: visit_matchas,
+        ast.MatchStar: visit_matchstar,
+        ast.MatchMapping: visit_matchmapping,
+    }
+    if sys.version_info >= (3, 11):
+        visitors[ast.TryStar] = visit_try
+    if sys.version_info >= (3, 12):
+        visitors[ast.TypeAlias] = visit_type_alias
+
+    # explicit stack, deeply nested expressions exceed the recursion limit
+    stack: List[Step] = nodes(reversed(tree.body), top)
+    pop, push, extend = stack.pop, stack.append, stack.extend
+    Name, Load = ast.Name, ast.Load
+    while stack:
+        step = pop()
+        if type(step) is not tuple:
+            extend(reversed(step()))
+            continue
+
+        node, block = step
+        node_type = type(node)
+        if node_type is Name:
+            # most frequent node, handled inline
+            name = node.id
+            if type(node.ctx) is Load:
+                block.add(name, USE)
+                if name == 'super' and block.type == 'function':
+                    block.add('__class__', USE)
+            else:
+                block.add(name, DEF_LOCAL)
+            continue
+
+        visitor = visitors.get(node_type)
+        if visitor is not None:
+            extend(reversed(visitor(node, block)))
+            continue
+
+        fields = CHILD_FIELDS.get(node_type)
+        if fields is None:
+            fields = CHILD_FIELDS[node_type] = child_fields(node_type)
+        for field in fields:
+            value = getattr(node, field)
+            if type(value) is list:
+                for child in reversed(value):
+                    if child is not None:
+                        push((child, block))
+            elif value is not None:
+                push((value, block))
+
+    if INLINE_COMPREHENSIONS:
+        inline_comprehensions(top)
+
+    return top.summary()
+
+
+def inline_comprehensions(block: Block) -> None:
+    """
+    merge comprehension scopes into their parents, as in
+    inline_comprehension from symtable.c (PEP 709)
+    """
+    children = []
+    for child in block.children:
+        inline_comprehensions(child)
+        if child.comprehension and not child.generator and not block.can_see_class_scope:
+            for name, flags in child.symbols.items():
+                if not flags & DEF_PARAM and name not in block.symbols:
+                    block.symbols[name] = flags
+            children.extend(child.children)
+            for grandchild in child.children:
+                grandchild.parent = block
+        else:
+            children.append(child)
+    block.children = children
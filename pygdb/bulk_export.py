@@ -0,0 +1,119 @@
+"""
+export of an SGraph to files
+for offline import with neo4j-admin
+"""
+from sgraph import SGraph, SEdgeType
+from snode import SNodeType
+from logging_settings import logger
+
+import gzip
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+# properties written for each node type, as (property, neo4j-admin type, default),
+# the same as the batch methods of the connectors write
+NODE_PROPERTIES: Dict[SNodeType, List[Tuple[str, str, object]]] = {
+    SNodeType.Package: [('name', 'string', None), ('packageName', 'string', None)],
+    SNodeType.Module: [('name', 'string', None), ('packageName', 'string', None)],
+    SNodeType.Class: [
+        ('name', 'string', None), ('moduleName', 'string', None), ('packageName', 'string', None),
+        ('docstring', 'string', ''),
+    ],
+    SNodeType.Function: [
+        ('name', 'string', None), ('moduleName', 'string', None), ('packageName', 'string', None),
+        ('docstring', 'string', ''), ('isAsync', 'boolean', False),
+    ],
+    SNodeType.Name: [
+        ('name', 'string', None), ('moduleName', 'string', None), ('packageName', 'string', None),
+        ('type', 'string', ''),
+    ],
+}
+
+# properties stored on SNode itself, the others are attrs
+SNODE_FIELDS = {'name': 'name', 'moduleName': 'modulename', 'packageName': 'packagename'}
+
+# edge types written with an alias, cf. _batch_method_edge_anyimport
+ALIASED_EDGE_TYPES = (SEdgeType.ImportedTo, SEdgeType.ImportsFrom)
+
+
+def csv_field(value) -> str:
+    """
+    strings are always quoted so that an empty string stays one,
+    None is an empty field which neo4j-admin reads as no property
+    """
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def csv_line(values) -> str:
+    return ','.join(map(csv_field, values)) + '\n'
+
+
+def open_data(path: Path, compress: bool):
+    if compress:
+        return gzip.open(path.with_name(path.name + '.gz'), 'wt', newline='', encoding='utf-8')
+    return open(path, 'w', newline='', encoding='utf-8')
+
+
+def write_neo4j_admin(sgraph: SGraph, out_dir: Union[str, Path], compress: bool = False) -> List[str]:
+    """
+    write a header and a data file for each node type and edge type of sgraph,
+    rows are written as they are read from sgraph so memory stays flat,
+    returns the arguments for neo4j-admin database import
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    suffix = '.gz' if compress else ''
+    import_args = []
+
+    for snodetype in SNodeType:
+        snodes = sgraph.snodes_of(snodetype)
+        if not snodes:
+            continue
+
+        properties = NODE_PROPERTIES[snodetype]
+        header_path, data_path = out_dir / f'nodes_{snodetype.value}_header.csv', out_dir / f'nodes_{snodetype.value}.csv'
+        with open(header_path, 'w', newline='', encoding='utf-8') as file:
+            file.write(','.join(['fullname:ID', *(f'{name}:{_type}' for name, _type, _ in properties)]) + '\n')
+
+        with open_data(data_path, compress) as file:
+            for snode in snodes:
+                row = [snode.fullname]
+                for name, _, default in properties:
+                    value = getattr(snode, SNODE_FIELDS[name]) if name in SNODE_FIELDS else snode.get_attr(name)
+                    row.append(default if value is None else value)
+                file.write(csv_line(row))
+
+        import_args.append(f'--nodes={snodetype.value}={header_path.name},{data_path.name}{suffix}')
+        logger.info(f'Exported {len(snodes)} nodes with label={snodetype.value!r}')
+
+    snode_list = sgraph.snode_list
+    for sedgetype, columns in sgraph.edge_columns.items():
+        aliased = sedgetype in ALIASED_EDGE_TYPES
+        header_path, data_path = out_dir / f'relationships_{sedgetype.value}_header.csv', out_dir / f'relationships_{sedgetype.value}.csv'
+        with open(header_path, 'w', newline='', encoding='utf-8') as file:
+            file.write(','.join([':START_ID', ':END_ID', 'count:long', 'firstLine:long', 'lastLine:long', *(['alias:string'] if aliased else [])]) + '\n')
+
+        alias_column = columns.columns.get('alias', {})
+        with open_data(data_path, compress) as file:
+            for row in range(len(columns)):
+                file.write(csv_line([
+                    snode_list[columns.src[row]].fullname,
+                    snode_list[columns.dst[row]].fullname,
+                    columns.counts[row],
+                    columns.first_lines[row] or None,
+                    columns.last_lines[row] or None,
+                    *([alias_column.get(row) or ''] if aliased else []),
+                ]))
+
+        import_args.append(f'--relationships={sedgetype.value}={header_path.name},{data_path.name}{suffix}')
+        logger.info(f'Exported {len(columns)} edges with type={sedgetype.value!r}')
+
+    # docstrings span several lines
+    import_args.append('--multiline-fields=true')
+    return import_args
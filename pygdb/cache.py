@@ -0,0 +1,122 @@
+"""
+on-disk caches of module summaries,
+shared between scans (and repositories),
+and of query results
+"""
+from logging_settings import logger
+from version import __version__
+
+import os
+import sys
+from abc import ABC, abstractmethod
+import hashlib
+import json
+import pickle
+import pathlib
+import tempfile
+from typing import Any, Dict, Tuple, Union
+
+
+class PickleCache(ABC):
+    """
+    values are pickled to separate files, named by path,
+    least recently used files are evicted once the cache exceeds max_size
+    """
+    cache_dir = pathlib.Path(os.environ.get('XDG_CACHE_HOME', pathlib.Path.home() / '.cache')) / 'pygdb'
+    max_size = 512 * 1024**2
+    # what is cached, for log messages
+    contents = 'entries'
+
+    def __init__(self, cache_dir: Union[str, pathlib.Path, None] = None, max_size: int | None = None):
+        self.cache_dir = pathlib.Path(cache_dir or self.cache_dir).resolve()
+        self.max_size = max_size or self.max_size
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def path(self, key) -> pathlib.Path:
+        """
+        file of the value of key
+        """
+
+    def get(self, key) -> Any | None:
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file:
+                value = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+
+        # mark as recently used
+        os.utime(path)
+        self.hits += 1
+        return value
+
+    def put(self, key, value) -> None:
+        # write to a temporary file first, so concurrent processes never read partial files
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix='.tmp', delete=False) as file:
+            pickle.dump(value, file)
+        os.replace(file.name, self.path(key))
+
+    def evict(self) -> None:
+        """
+        remove least recently used files
+        until the cache fits into max_size
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.pickle'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # evicted by another scan meanwhile
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            removed += 1
+
+        if removed:
+            logger.info(f'Evicted {removed} {self.contents} from cache at {self.cache_dir}')
+
+
+class SummaryCache(PickleCache):
+    """
+    module summaries, keyed by
+    (content hash, Python version, pygdb version)
+    """
+    contents = 'summaries'
+
+    def path(self, content_hash: str) -> pathlib.Path:
+        key = hashlib.sha1(f'{content_hash}-{sys.version_info[:2]}-{__version__}'.encode()).hexdigest()
+        return self.cache_dir / f'{key}.pickle'
+
+
+class QueryCache(PickleCache):
+    """
+    records and rendered output of queries, keyed by
+    (query, parameters, database, data version stamp, pygdb version),
+    add and clear write a new stamp, so results of older data are never
+    read again and leave the cache by eviction
+    """
+    cache_dir = PickleCache.cache_dir / 'queries'
+    max_size = 64 * 1024**2
+    contents = 'query results'
+
+    def path(self, key: Tuple[str, Dict, str, str]) -> pathlib.Path:
+        # parameters of equal value hash alike whatever their order
+        digest = hashlib.sha1(json.dumps([*key, __version__], sort_keys=True, default=str).encode()).hexdigest()
+        return self.cache_dir / f'{digest}.pickle'
+
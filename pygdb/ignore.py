@@ -0,0 +1,111 @@
+"""
+exclusion of files and directories from a scan,
+with the pattern syntax of .gitignore
+"""
+import re
+from pathlib import PurePosixPath
+from typing import Iterable, List, NamedTuple, Tuple
+
+# never scanned unless negated by a later pattern,
+# virtual environments are recognized by their pyvenv.cfg
+DEFAULT_EXCLUDES = (
+    '.git/', '.hg/', '.svn/', '__pycache__/', 'node_modules/',
+    '.tox/', '.nox/', '.mypy_cache/', '.pytest_cache/', '*.egg-info/',
+)
+
+
+class Rule(NamedTuple):
+    # directory of the .gitignore, patterns with a slash are relative to it
+    base: PurePosixPath
+    regex: re.Pattern
+    anchored: bool
+    negate: bool
+    dir_only: bool
+
+
+def translate(glob: str) -> str:
+    """
+    regex for a glob where * and ? stop at slashes and ** crosses them
+    """
+    regex, idx = '', 0
+    while idx < len(glob):
+        char = glob[idx]
+        if glob.startswith('**/', idx):
+            regex, idx = regex + '(?:.*/)?', idx + 3
+            continue
+        if glob.startswith('/**', idx) and idx + 3 == len(glob):
+            regex, idx = regex + '/.*', idx + 3
+            continue
+        if glob.startswith('**', idx):
+            regex, idx = regex + '.*', idx + 2
+            continue
+
+        if char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[' and (end := glob.find(']', idx + 2)) != -1:
+            members = glob[idx + 1:end]
+            if members[0] in '!^':
+                members = '^' + members[1:]
+            regex, idx = regex + '[' + members.replace('\\', '\\\\') + ']', end
+        elif char == '\\' and idx + 1 < len(glob):
+            idx += 1
+            regex += re.escape(glob[idx])
+        else:
+            regex += re.escape(char)
+        idx += 1
+    return regex
+
+
+def parse_rules(lines: Iterable[str], base: PurePosixPath = PurePosixPath()) -> List[Rule]:
+    rules = []
+    for line in lines:
+        line = line.rstrip('\n')
+        if not line.endswith('\\ '):
+            line = line.rstrip()
+        if not line or line.startswith('#'):
+            continue
+
+        negate = line.startswith('!')
+        if negate or line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        # a slash other than a trailing one anchors the pattern to base
+        anchored = '/' in line
+        rules.append(Rule(base, re.compile(translate(line.lstrip('/'))), anchored, negate, dir_only))
+    return rules
+
+
+class IgnoreRules:
+    """
+    patterns of .gitignore files and exclude globs, later patterns win,
+    paths are relative to the top directory the patterns were read from
+    """
+    def __init__(self, rules: Tuple[Rule, ...] = ()):
+        self.rules = rules
+
+    def extended(self, lines: Iterable[str], base: PurePosixPath = PurePosixPath()) -> 'IgnoreRules':
+        """
+        rules with those of a .gitignore in directory base added
+        """
+        new_rules = parse_rules(lines, base)
+        return IgnoreRules(self.rules + tuple(new_rules)) if new_rules else self
+
+    def match(self, path: PurePosixPath, is_dir: bool) -> bool | None:
+        """
+        if the last pattern matching path excludes it, None if none matches,
+        the parent directories of path are expected not to be excluded
+        """
+        matched = None
+        for rule in self.rules:
+            if matched == (not rule.negate) or (rule.dir_only and not is_dir):
+                continue
+            # patterns of a .gitignore only apply below its directory
+            if rule.base not in path.parents:
+                continue
+            subject = path.relative_to(rule.base).as_posix() if rule.anchored else path.name
+            if rule.regex.fullmatch(subject):
+                matched = not rule.negate
+        return matched
@@ -0,0 +1,84 @@
+"""
+ordering of modules for the third pass,
+import cycles are condensed into strongly connected components
+"""
+from typing import List, Dict, Callable, Iterable, Hashable, TypeVar
+
+Node = TypeVar('Node', bound=Hashable)
+
+
+def strongly_connected_components(roots: Iterable[Node], successors: Callable[[Node], Iterable[Node]]) -> List[List[Node]]:
+    """
+    iterative Tarjan's algorithm over nodes reachable from roots,
+    components are returned in topological order with successors first
+    and members of a component in the order they were finished
+    (for acyclic graphs this is the DFS postorder)
+    """
+    index: Dict[Node, int] = {}
+    lowlink: Dict[Node, int] = {}
+    finished: Dict[Node, int] = {}
+    on_stack = set()
+    stack: List[Node] = []
+    components: List[List[Node]] = []
+
+    for root in roots:
+        if root in index:
+            continue
+
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        # explicit call stack of (node, iterator over its successors)
+        work = [(root, iter(successors(root)))]
+
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(successors(child))))
+                    break
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else:
+                # all successors done
+                work.pop()
+                finished[node] = len(finished)
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member is node:
+                            break
+                    component.sort(key=finished.get)
+                    components.append(component)
+
+    return components
+
+
+def dependency_levels(components: List[List[Node]], successors: Callable[[Node], Iterable[Node]]) -> List[int]:
+    """
+    level of each component (in the order of strongly_connected_components),
+    0 if it depends on no other component and otherwise one more than the
+    highest level among its dependencies, so components on the same level
+    are independent of each other
+    """
+    component_of: Dict[Node, int] = {member: idx for idx, component in enumerate(components) for member in component}
+    levels: List[int] = []
+    for idx, component in enumerate(components):
+        # dependencies come first, their levels are known
+        level = 0
+        for member in component:
+            for child in successors(member):
+                if (child_idx := component_of.get(child, idx)) != idx:
+                    level = max(level, levels[child_idx] + 1)
+        levels.append(level)
+    return levels
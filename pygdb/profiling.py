@@ -0,0 +1,209 @@
+"""
+profiling of scans, wall and CPU time of each phase and module,
+memory traced only when asked for since tracemalloc slows the passes down
+"""
+from logging_settings import logger
+
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Union
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+
+def max_rss() -> int | None:
+    """
+    peak resident set size of the process in bytes
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes except on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def cpu_times(start: os.times_result, end: os.times_result) -> Dict[str, float]:
+    """
+    CPU time of the process between two os.times, and of its children
+    (summarize_modules workers) once they exited
+    """
+    return {
+        'cpu': round(end.user + end.system - start.user - start.system, 6),
+        'children_cpu': round(end.children_user + end.children_system - start.children_user - start.children_system, 6),
+    }
+
+
+class StackSampler(threading.Thread):
+    """
+    samples the stack of a thread at a fixed interval,
+    counts are written as collapsed stacks for flame graphs
+    """
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+
+    def write(self, path: Union[str, Path]) -> None:
+        with open(path, 'w') as file:
+            for stack, count in self.counts.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+class ScanProfile:
+    """
+    phases are consecutive, each one ends where the next starts,
+    per_module times the passes of each module, cprofile and sample_stacks
+    cover the thread running the scan between start and stop
+    """
+    def __init__(self, trace_memory: bool = False, per_module: bool = False, cprofile: bool = False, sample_stacks: bool = False):
+        self.trace_memory = trace_memory and not tracemalloc.is_tracing()
+        if self.trace_memory:
+            tracemalloc.start()
+        self.per_module = per_module
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.sample_stacks = sample_stacks
+        self.sampler: StackSampler | None = None
+
+        # [{'phase': name, 'wall': s, 'cpu': s, ...}] in order
+        self.phases: List[Dict] = []
+        # {module: {phase: s}}
+        self.modules: Dict[str, Dict[str, float]] = {}
+        # counts added to the report, e.g. graph size
+        self.details: Dict[str, object] = {}
+
+        self.start_wall = self.phase_wall = time.perf_counter()
+        self.start_times = self.phase_times = os.times()
+
+    def start(self) -> None:
+        if self.cprofile is not None:
+            self.cprofile.enable()
+        if self.sample_stacks:
+            self.sampler = StackSampler(threading.get_ident())
+            self.sampler.start()
+
+    def stop(self) -> None:
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def end_phase(self, phase: str) -> Dict:
+        """
+        record the phase ending now and start the next one
+        """
+        wall, times = time.perf_counter(), os.times()
+        record = {
+            'phase': phase,
+            'wall': round(wall - self.phase_wall, 6),
+            **cpu_times(self.phase_times, times),
+            'max_rss': max_rss(),
+        }
+        if self.trace_memory and tracemalloc.is_tracing():
+            record['traced_current'], record['traced_peak'] = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        self.phases.append(record)
+        self.phase_wall, self.phase_times = wall, times
+        return record
+
+    @contextmanager
+    def module(self, name: str, phase: str):
+        if not self.per_module:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_module(name, phase, time.perf_counter() - start)
+
+    def record_module(self, name: str, phase: str, seconds: float) -> None:
+        """
+        add time spent on a module, e.g. measured in a worker process
+        """
+        if not self.per_module:
+            return
+        times = self.modules.setdefault(name, {})
+        times[phase] = times.get(phase, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start_wall
+
+    def peak_memory(self) -> int | None:
+        """
+        highest traced peak of a phase, max RSS if memory is not traced
+        """
+        if self.trace_memory:
+            return max((record.get('traced_peak', 0) for record in self.phases), default=0)
+        return max_rss()
+
+    def report(self, top: int = 10) -> Dict:
+        slowest = sorted(self.modules.items(), key=lambda item: sum(item[1].values()), reverse=True)[:top]
+        return {
+            'wall': round(self.elapsed(), 6),
+            **cpu_times(self.start_times, os.times()),
+            'max_rss': max_rss(),
+            'memory_traced': self.trace_memory,
+            'phases': self.phases,
+            'modules': {
+                'count': len(self.modules),
+                'slowest': [
+                    {'module': name, 'total': round(sum(phases.values()), 6), **{phase: round(seconds, 6) for phase, seconds in phases.items()}}
+                    for name, phases in slowest
+                ],
+            },
+            **self.details,
+        }
+
+    def finish(self) -> None:
+        """
+        stop tracing memory, the phases recorded are kept
+        """
+        if self.trace_memory:
+            tracemalloc.stop()
+
+    def save(
+            self,
+            report_path: Union[str, Path, None] = None,
+            top: int = 10,
+            cprofile_path: Union[str, Path, None] = None,
+            collapsed_path: Union[str, Path, None] = None
+    ) -> None:
+        if report_path is not None:
+            with open(report_path, 'w') as file:
+                json.dump(self.report(top), file, indent=2)
+            logger.info(f'Saved profile report to {report_path}')
+        if cprofile_path is not None and self.cprofile is not None:
+            self.cprofile.dump_stats(cprofile_path)
+            logger.info(f'Saved cProfile statistics to {cprofile_path}')
+        if collapsed_path is not None and self.sampler is not None:
+            self.sampler.write(collapsed_path)
+            logger.info(f'Saved {sum(self.sampler.counts.values())} sampled stacks to {collapsed_path}')
@@ -0,0 +1,93 @@
+"""
+chained scopes, each snode's scope_dict only holds the bindings made in it,
+bindings propagated from descendants are found through a shared index
+"""
+from snode import SNode
+
+from typing import List, Dict, Tuple, Iterator
+
+
+class ScopeIndex:
+    """
+    view of snode scopes as if every propagated binding had been
+    copied into the scope_dict of all ancestors
+    """
+    def __init__(self):
+        # {key: [snodes the key was propagated from]}
+        self.origins: Dict[str, List[SNode]] = {}
+
+        # {snode: [child snodes with propagated bindings in their subtree]}
+        self.children: Dict[SNode, List[SNode]] = {}
+
+        # {key: position of its first binding}, keeps the order of a merged dict
+        self.order: Dict[str, int] = {}
+
+    def bind(self, snode: SNode, new_dict: Dict, propagate: bool = True) -> None:
+        """
+        add bindings to the scope of snode,
+        visible to its ancestors if propagate is set
+        """
+        if not snode.scope_dict:
+            # snodes without bindings share an empty dict
+            snode.scope_dict = {}
+        snode.scope_dict.update(new_dict)
+        for key in new_dict:
+            if key not in self.order:
+                self.order[key] = len(self.order)
+
+        if not propagate or not new_dict:
+            return
+
+        for key in new_dict:
+            origins = self.origins.setdefault(key, [])
+            if snode not in origins:
+                origins.append(snode)
+
+        # register path to the root so that subtrees can be walked
+        child, parent = snode, snode.scope_parent
+        while parent is not None:
+            siblings = self.children.setdefault(parent, [])
+            if child in siblings:
+                break
+            siblings.append(child)
+            child, parent = parent, parent.scope_parent
+
+    def propagated_to(self, snode: SNode, key: str) -> bool:
+        """
+        if key was propagated to snode from one of its descendants
+        """
+        for origin in self.origins.get(key, ()):
+            ancestor = origin.scope_parent
+            while ancestor is not None:
+                if ancestor is snode:
+                    return True
+                ancestor = ancestor.scope_parent
+        return False
+
+    def contains(self, snode: SNode, key: str) -> bool:
+        return key in snode.scope_dict or self.propagated_to(snode, key)
+
+    def get(self, snode: SNode, key: str, default=None):
+        if key in snode.scope_dict:
+            return snode.scope_dict[key]
+        # propagated bindings are {fullname: fullname}
+        return key if self.propagated_to(snode, key) else default
+
+    def items(self, snode: SNode) -> List[Tuple]:
+        """
+        all bindings visible in the scope of snode,
+        in the order they were first made
+        """
+        merged = dict(snode.scope_dict)
+        for descendant in self.descendants(snode):
+            for key in descendant.scope_dict:
+                if key not in merged and descendant in self.origins.get(key, ()):
+                    merged[key] = key
+        return sorted(merged.items(), key=lambda item: self.order[item[0]])
+
+    def descendants(self, snode: SNode) -> Iterator[SNode]:
+        stack = list(self.children.get(snode, ()))
+        while stack:
+            descendant = stack.pop()
+            yield descendant
+            stack.extend(self.children.get(descendant, ()))
@@ -5,10 +5,20 @@ to be later imported into a database
 from graphviz import Digraph
 
 from logging_settings import logger
-from snode import SNode, Dotstring, SNodeType
+from snode import SNode, Dotstring, SNodeType, NO_BINDINGS
 
+from array import array
 from enum import Enum
-from typing import Tuple, Set, Dict
+import gc
+from itertools import repeat
+import mmap
+from operator import lshift, or_
+import os
+import pickle
+import struct
+import sys
+from pathlib import Path
+from typing import Tuple, Dict, List, Iterator, Sequence, Any, BinaryIO, Union
 
 
 class SEdgeType(Enum):
@@ -73,6 +83,266 @@ class SEdge:
         return self.snodes[1]
 
 
+SEDGE_TYPES: List[SEdgeType] = list(SEdgeType)
+
+
+class EdgeColumns:
+    """
+    edges of one type as parallel arrays of node ids,
+    attributes are kept in sparse columns
+    """
+    __slots__ = ('src', 'dst', 'rows', 'columns', 'counts', 'first_lines', 'last_lines')
+
+    def __init__(self):
+        self.src = array('q')
+        self.dst = array('q')
+
+        # times each edge was added, first and last line it was added on (0 if unknown)
+        self.counts = array('q')
+        self.first_lines = array('q')
+        self.last_lines = array('q')
+
+        # {src << 32 | dst: row}, an edge is stored once,
+        # None until needed for columns read from a snapshot
+        self.rows: Dict[int, int] | None = {}
+
+        # {attribute name: {row: value}}
+        self.columns: Dict[str, Dict[int, Any]] = {}
+
+    @classmethod
+    def from_arrays(cls, src: array, dst: array, counts: array, first_lines: array, last_lines: array) -> 'EdgeColumns':
+        columns = cls()
+        columns.src, columns.dst = src, dst
+        columns.counts, columns.first_lines, columns.last_lines = counts, first_lines, last_lines
+        columns.rows = None
+        return columns
+
+    def index_rows(self) -> Dict[int, int]:
+        # keys as in add, computed without a python loop
+        self.rows = dict(zip(map(or_, map(lshift, self.src, repeat(32)), self.dst), range(len(self.src))))
+        return self.rows
+
+    def __len__(self):
+        return len(self.src)
+
+    def add(self, src: int, dst: int, attrs: Dict, line: int | None = None) -> bool:
+        """
+        add edge if not present, otherwise count it again,
+        attributes of the first occurrence are kept
+        """
+        key = src << 32 | dst
+        rows = self.rows if self.rows is not None else self.index_rows()
+        row = rows.get(key)
+        if row is not None:
+            self.counts[row] += 1
+            if line:
+                if not self.first_lines[row] or line < self.first_lines[row]:
+                    self.first_lines[row] = line
+                if line > self.last_lines[row]:
+                    self.last_lines[row] = line
+            return False
+
+        row = rows[key] = len(self.src)
+        self.src.append(src)
+        self.dst.append(dst)
+        self.counts.append(1)
+        self.first_lines.append(line or 0)
+        self.last_lines.append(line or 0)
+        for name, value in attrs.items():
+            self.columns.setdefault(name, {})[row] = value
+        return True
+
+    def row_attrs(self, row: int) -> Dict:
+        attrs = {name: column[row] for name, column in self.columns.items() if row in column}
+        attrs['count'] = self.counts[row]
+        if self.first_lines[row]:
+            attrs['firstLine'], attrs['lastLine'] = self.first_lines[row], self.last_lines[row]
+        return attrs
+
+
+class Adjacency:
+    """
+    edges of every node in one direction, the edges of node i
+    are (types[k], rows[k]) for offsets[i] <= k < offsets[i+1]
+    """
+    __slots__ = ('offsets', 'types', 'rows')
+
+    def __init__(self, offsets: array, types: array, rows: array):
+        self.offsets = offsets
+        self.types = types
+        self.rows = rows
+
+    @classmethod
+    def build(cls, num_snodes: int, edge_columns: Dict[SEdgeType, 'EdgeColumns'], outgoing: bool) -> 'Adjacency':
+        """
+        counting sort of all edges by source or target id
+        """
+        offsets = array('q', bytes(8 * (num_snodes + 1)))
+        for columns in edge_columns.values():
+            for sid in (columns.src if outgoing else columns.dst):
+                offsets[sid + 1] += 1
+        for idx in range(num_snodes):
+            offsets[idx + 1] += offsets[idx]
+
+        size = offsets[num_snodes]
+        types, rows = array('b', bytes(size)), array('q', bytes(8 * size))
+        fill = offsets[:-1]
+        for sedgetype, columns in edge_columns.items():
+            type_idx = SEDGE_TYPES.index(sedgetype)
+            for row, sid in enumerate(columns.src if outgoing else columns.dst):
+                pos = fill[sid]
+                types[pos], rows[pos] = type_idx, row
+                fill[sid] = pos + 1
+        return cls(offsets, types, rows)
+
+    def refs(self, sid: int) -> Iterator[Tuple[SEdgeType, int]]:
+        for pos in range(self.offsets[sid], self.offsets[sid + 1]):
+            yield SEDGE_TYPES[self.types[pos]], self.rows[pos]
+
+
+class SEdgeView:
+    """
+    edges of an SGraph as SEdge objects,
+    built when iterated over
+    """
+    def __init__(self, sgraph: 'SGraph', sedgetypes: Tuple[SEdgeType, ...] | None = None):
+        self.sgraph = sgraph
+        self.sedgetypes = sedgetypes
+
+    def _columns(self) -> Iterator[Tuple[SEdgeType, EdgeColumns]]:
+        if self.sedgetypes is None:
+            yield from self.sgraph.edge_columns.items()
+        else:
+            for sedgetype in self.sedgetypes:
+                if (columns := self.sgraph.edge_columns.get(sedgetype)) is not None:
+                    yield sedgetype, columns
+
+    def __len__(self):
+        return sum(len(columns) for _, columns in self._columns())
+
+    def __iter__(self) -> Iterator[SEdge]:
+        snode_list = self.sgraph.snode_list
+        for sedgetype, columns in self._columns():
+            for row, (src, dst) in enumerate(zip(columns.src, columns.dst)):
+                yield SEdge((snode_list[src], snode_list[dst]), sedgetype, **columns.row_attrs(row))
+
+
+SNODE_TYPES: List[SNodeType] = list(SNodeType)
+
+# snapshot files start with the magic and the format version
+SNAPSHOT_MAGIC = b'PYGDBSNP'
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct('<8sI4x')
+_ARRAY_HEADER = struct.Struct('<c7xq')
+
+# snapshots are little-endian
+_SWAP = sys.byteorder != 'little'
+
+
+def _write_array(file: BinaryIO, arr: array) -> None:
+    """
+    typecode and length, then the items padded to 8 bytes,
+    so that every array starts aligned in a mapped file
+    """
+    if _SWAP:
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    file.write(_ARRAY_HEADER.pack(arr.typecode.encode(), len(arr)))
+    data = arr.tobytes()
+    file.write(data)
+    file.write(bytes(-len(data) % 8))
+
+
+def _read_array(view: memoryview, pos: int) -> Tuple[array, int]:
+    typecode, length = _ARRAY_HEADER.unpack_from(view, pos)
+    arr = array(typecode.decode())
+    pos += _ARRAY_HEADER.size
+    end = pos + length * arr.itemsize
+    arr.frombytes(view[pos:end])
+    if _SWAP:
+        arr.byteswap()
+    return arr, end + (-end % 8)
+
+
+def _write_strings(file: BinaryIO, strings: List[str]) -> None:
+    """
+    string table as the offsets of each string
+    in the concatenation of all and its utf-8 encoding
+    """
+    offsets = array('q', [0])
+    for string in strings:
+        offsets.append(offsets[-1] + len(string))
+    _write_array(file, offsets)
+    _write_array(file, array('B', ''.join(strings).encode('utf-8', 'surrogatepass')))
+
+
+def _read_strings(view: memoryview, pos: int) -> Tuple[List[str], int]:
+    offsets, pos = _read_array(view, pos)
+    blob, pos = _read_array(view, pos)
+    text = blob.tobytes().decode('utf-8', 'surrogatepass')
+    return [text[start:end] for start, end in zip(offsets, offsets[1:])], pos
+
+
+class _StringTable:
+    """
+    ids of strings in order of first use
+    """
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+
+    def id(self, string: str | None) -> int:
+        if string is None:
+            return -1
+        idx = self.ids.get(string)
+        if idx is None:
+            idx = self.ids[string] = len(self.ids)
+        return idx
+
+    @property
+    def strings(self) -> List[str]:
+        return list(self.ids)
+
+
+def _encode_attr_columns(columns: Dict[str, Dict[int, Any]], values: _StringTable) -> List[array]:
+    """
+    sparse attribute columns as arrays of name and kind, rows, and values,
+    values are ids of strings (or None), bools, ints, or pickled when of any other type
+    """
+    arrays = [array('q', [len(columns)])]
+    for name, column in columns.items():
+        items = list(column.values())
+        if all(value is None or isinstance(value, str) for value in items):
+            kind, data = 's', array('q', map(values.id, items))
+        elif all(isinstance(value, bool) for value in items):
+            kind, data = 'b', array('b', items)
+        elif all(type(value) is int for value in items):
+            kind, data = 'i', array('q', items)
+        else:
+            kind, data = 'p', array('B', pickle.dumps(items))
+        arrays.extend((array('q', [values.id(name), ord(kind)]), array('q', column), data))
+    return arrays
+
+
+def _read_attr_columns(view: memoryview, pos: int, values: List[str]) -> Tuple[Dict[str, Dict[int, Any]], int]:
+    (num_columns,), pos = _read_array(view, pos)
+    columns = {}
+    for _ in range(num_columns):
+        (name_id, kind), pos = _read_array(view, pos)
+        rows, pos = _read_array(view, pos)
+        data, pos = _read_array(view, pos)
+        kind = chr(kind)
+        if kind == 's':
+            items = [values[idx] if idx != -1 else None for idx in data]
+        elif kind == 'b':
+            items = [bool(value) for value in data]
+        elif kind == 'i':
+            items = data.tolist()
+        else:
+            items = pickle.loads(data.tobytes())
+        columns[values[name_id]] = dict(zip(rows, items))
+    return columns, pos
+
+
 class SGraph:
     """
     intermediate graph form
@@ -81,16 +351,154 @@ class SGraph:
         """
         dictionary of the form
             node fullname: SNode object
-        list of edges
+        and edges stored by type, see EdgeColumns
         """
         self.snodes: Dict[Dotstring, SNode] = {}
-        self.sedges: Set[SEdge] = set()
+
+        # node ids used by the edge store, in order of insertion
+        self.snode_ids: Dict[Dotstring, int] = {}
+        self.snode_list: List[SNode] = []
+
+        self.edge_columns: Dict[SEdgeType, EdgeColumns] = {}
+
+        # {node type: {fullname: SNode}}, kept up to date by _add_snode and set_snodetype
+        self.snodes_by_type: Dict[SNodeType, Dict[Dotstring, SNode]] = {snodetype: {} for snodetype in SNodeType}
+
+        # (outgoing, incoming), built on first use after edges were added
+        self._adjacency: Tuple[Adjacency, Adjacency] | None = None
+
+    @property
+    def sedges(self) -> SEdgeView:
+        return SEdgeView(self)
+
+    def sedges_of(self, *sedgetypes: SEdgeType) -> SEdgeView:
+        return SEdgeView(self, sedgetypes)
+
+    def snodes_of(self, *snodetypes: SNodeType) -> List[SNode]:
+        return [snode for snodetype in snodetypes for snode in self.snodes_by_type.get(snodetype, {}).values()]
+
+    def set_snodetype(self, snode: SNode, snodetype: SNodeType) -> None:
+        if snode.snodetype is snodetype:
+            return
+        if self.snodes_by_type.get(snode.snodetype, {}).pop(snode.fullname, None) is not None:
+            self.snodes_by_type.setdefault(snodetype, {})[snode.fullname] = snode
+        snode.snodetype = snodetype
+
+    def adjacency(self) -> Tuple[Adjacency, Adjacency]:
+        if self._adjacency is None:
+            num_snodes = len(self.snode_list)
+            self._adjacency = (
+                Adjacency.build(num_snodes, self.edge_columns, outgoing=True),
+                Adjacency.build(num_snodes, self.edge_columns, outgoing=False),
+            )
+        return self._adjacency
+
+    def out_sedges(self, snode: SNode) -> List[SEdge]:
+        return self._adjacent_sedges(snode, outgoing=True)
+
+    def in_sedges(self, snode: SNode) -> List[SEdge]:
+        return self._adjacent_sedges(snode, outgoing=False)
+
+    def _adjacent_sedges(self, snode: SNode, outgoing: bool) -> List[SEdge]:
+        sid = self.snode_ids.get(snode.fullname)
+        if sid is None:
+            raise ValueError(f'Node {snode=} does not exist.')
+
+        adjacency = self.adjacency()[0 if outgoing else 1]
+        sedges = []
+        for sedgetype, row in adjacency.refs(sid):
+            columns = self.edge_columns[sedgetype]
+            first, second = self.snode_list[columns.src[row]], self.snode_list[columns.dst[row]]
+            sedges.append(SEdge((first, second), sedgetype, **columns.row_attrs(row)))
+        return sedges
+
+    def edge_records(self, sedgetype: SEdgeType, rows: Sequence[int] | None = None) -> List[Dict]:
+        """
+        edges of one type, optionally only the given rows,
+        as dictionaries with fullnames as first and second, for export
+        """
+        columns = self.edge_columns.get(sedgetype)
+        if columns is None:
+            return []
+
+        if rows is None:
+            rows = range(len(columns))
+        snode_list = self.snode_list
+        records = [
+            {
+                'first': snode_list[columns.src[row]].fullname,
+                'second': snode_list[columns.dst[row]].fullname,
+                'count': columns.counts[row],
+                'firstLine': columns.first_lines[row] or None,
+                'lastLine': columns.last_lines[row] or None,
+            }
+            for row in rows
+        ]
+        for name, column in columns.columns.items():
+            for record, row in zip(records, rows):
+                if row in column:
+                    record[name] = column[row]
+        return records
+
+    def node_batches(self, batch_size: int) -> Iterator[Tuple[SNodeType, List[Dict]]]:
+        """
+        vars of all nodes in batches of at most batch_size,
+        each batch holds nodes of one type
+        """
+        for snodetype in SNodeType:
+            snodes = self.snodes_of(snodetype)
+            for start in range(0, len(snodes), batch_size):
+                yield snodetype, [vars(snode) for snode in snodes[start:start + batch_size]]
+
+    def endpoint_groups(self, sedgetype: SEdgeType, rows: Sequence[int] | None = None) -> Dict[Tuple[SNodeType, SNodeType], array]:
+        """
+        rows of the edges of one type, optionally only the given rows,
+        grouped by the types of their first and second node
+        """
+        groups: Dict[Tuple[SNodeType, SNodeType], array] = {}
+        columns = self.edge_columns.get(sedgetype)
+        if columns is None:
+            return groups
+
+        snode_list = self.snode_list
+        src, dst = columns.src, columns.dst
+        for row in (range(len(columns)) if rows is None else rows):
+            key = (snode_list[src[row]].snodetype, snode_list[dst[row]].snodetype)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = array('q')
+            group.append(row)
+        return groups
+
+    def edge_batches(self, batch_size: int) -> Iterator[Tuple[SEdgeType, SNodeType, SNodeType, List[Dict]]]:
+        """
+        edge_records of all edges in batches of at most batch_size,
+        each batch holds edges of one type between nodes
+        of one type each, given with the batch
+        """
+        for sedgetype in self.edge_columns:
+            for (first_type, second_type), rows in self.endpoint_groups(sedgetype).items():
+                for start in range(0, len(rows), batch_size):
+                    yield sedgetype, first_type, second_type, self.edge_records(sedgetype, rows[start:start + batch_size])
+
+    def edge_triples(self) -> Iterator[Tuple[Dotstring, Dotstring, SEdgeType]]:
+        """
+        (first fullname, second fullname, type) of all edges
+        """
+        snode_list = self.snode_list
+        for sedgetype, columns in self.edge_columns.items():
+            for src, dst in zip(columns.src, columns.dst):
+                yield snode_list[src].fullname, snode_list[dst].fullname, sedgetype
 
     def _add_snode(self, snode: SNode) -> None:
         if snode.fullname not in self.snodes:
             self.snodes.update({
                 snode.fullname: snode
             })
+            self.snode_ids[snode.fullname] = len(self.snode_list)
+            self.snode_list.append(snode)
+            self.snodes_by_type.setdefault(snode.snodetype, {})[snode.fullname] = snode
+            self._adjacency = None
         else:
             logger.warning(f'Node `{snode.fullname}` already exists. No actions taken.')
 
@@ -101,14 +509,24 @@ class SGraph:
             else:
                 raise TypeError(f'Nodes must be of type `SNode`, {type(snode)} was passed instead.')
 
-    def _add_sedge(self, sedge: SEdge) -> None:
-        first, second = sedge.snodes
-        if first.fullname not in self.snodes:
+    def add_edge(self, first: SNode, second: SNode, sedgetype: SEdgeType, line: int | None = None, **attrs) -> None:
+        """
+        add edge without making an SEdge,
+        an existing edge is counted again
+        """
+        if (src := self.snode_ids.get(first.fullname)) is None:
             raise ValueError(f'Node {first=} does not exist.')
-        if second.fullname not in self.snodes:
+        if (dst := self.snode_ids.get(second.fullname)) is None:
             raise ValueError(f'Node {second=} does not exist.')
 
-        self.sedges.add(sedge)
+        columns = self.edge_columns.get(sedgetype)
+        if columns is None:
+            columns = self.edge_columns[sedgetype] = EdgeColumns()
+        if columns.add(src, dst, attrs, line):
+            self._adjacency = None
+
+    def _add_sedge(self, sedge: SEdge) -> None:
+        self.add_edge(*sedge.snodes, sedge.sedgetype, **sedge.attrs)
 
     def add_sedges(self, *sedges) -> None:
         for sedge in sedges:
@@ -117,6 +535,130 @@ class SGraph:
             else:
                 raise TypeError(f'Edges must be of type `SEdge`, {type(sedge)} was passed instead.')
 
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        write a snapshot of nodes and edges, see load,
+        attributes starting with '__' are internal to the scan and not saved
+        """
+        names, values = _StringTable(), _StringTable()
+        snode_ids = self.snode_ids
+
+        # fullname, name, namespace, modulename, packagename, scope parent, type
+        node_fields = [array('q') for _ in range(6)] + [array('b')]
+        node_attrs: Dict[str, Dict[int, Any]] = {}
+        for sid, snode in enumerate(self.snode_list):
+            scope_parent = snode.scope_parent
+            for field, value in zip(node_fields, (
+                names.id(snode.fullname), names.id(snode.name), names.id(snode.namespace),
+                names.id(snode.modulename), names.id(snode.packagename),
+                snode_ids.get(scope_parent.fullname, -1) if scope_parent is not None else -1,
+                SNODE_TYPES.index(snode.snodetype),
+            )):
+                field.append(value)
+            if snode._attrs:
+                for key, value in snode._attrs.items():
+                    if not key.startswith('__'):
+                        node_attrs.setdefault(key, {})[sid] = value
+
+        body = node_fields + _encode_attr_columns(node_attrs, values)
+        body.append(array('q', [len(self.edge_columns)]))
+        for sedgetype, columns in self.edge_columns.items():
+            body.extend((
+                array('q', [SEDGE_TYPES.index(sedgetype)]),
+                columns.src, columns.dst, columns.counts, columns.first_lines, columns.last_lines,
+            ))
+            body.extend(_encode_attr_columns(columns.columns, values))
+
+        # written next to path and then moved, a snapshot is never left half written
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as file:
+            file.write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION))
+            _write_strings(file, names.strings)
+            _write_strings(file, values.strings)
+            for arr in body:
+                _write_array(file, arr)
+        os.replace(tmp_path, path)
+        logger.info(f'Saved snapshot of {len(self.snode_list)} nodes and {len(self.sedges)} edges to {path}.')
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'SGraph':
+        """
+        read a snapshot written by save,
+        the file is mapped and its arrays copied without parsing
+        """
+        # nodes are allocated in bulk and none of them is garbage,
+        # collections triggered meanwhile would only walk them again
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                return cls._from_snapshot(view)
+            finally:
+                view.release()
+                if gc_enabled:
+                    gc.enable()
+
+    @classmethod
+    def _from_snapshot(cls, view: memoryview) -> 'SGraph':
+        magic, version = _SNAPSHOT_HEADER.unpack_from(view, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError('Not an SGraph snapshot.')
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f'Snapshot format version {version} is not supported, expected {SNAPSHOT_VERSION}.')
+
+        pos = _SNAPSHOT_HEADER.size
+        names, pos = _read_strings(view, pos)
+        names = Dotstring.intern_all(names)
+        values, pos = _read_strings(view, pos)
+        # id -1 is None
+        names.append(None)
+        values.append(None)
+
+        node_fields = []
+        for _ in range(7):
+            field, pos = _read_array(view, pos)
+            node_fields.append(field)
+        node_attrs, pos = _read_attr_columns(view, pos, values)
+
+        sgraph = cls()
+        fullnames = list(map(names.__getitem__, node_fields[0]))
+        snode_list = [SNode.__new__(SNode) for _ in fullnames]
+        snodes_by_type = [sgraph.snodes_by_type[snodetype] for snodetype in SNODE_TYPES]
+        for snode, fullname, name, namespace, modulename, packagename, parent_id, type_idx in zip(
+                snode_list, fullnames, *(map(names.__getitem__, field) for field in node_fields[1:5]),
+                node_fields[5], node_fields[6]
+        ):
+            # slots are set directly, the names are interned already
+            snode.fullname, snode.name, snode.namespace = fullname, name, namespace
+            snode.modulename, snode.packagename, snode.snodetype = modulename, packagename, SNODE_TYPES[type_idx]
+            snode.scope_dict, snode._attrs = NO_BINDINGS, None
+            snode.scope_parent = snode_list[parent_id] if parent_id != -1 else None
+            snodes_by_type[type_idx][fullname] = snode
+
+        for key, column in node_attrs.items():
+            for sid, value in column.items():
+                snode = snode_list[sid]
+                if snode._attrs is None:
+                    snode._attrs = {}
+                snode._attrs[key] = value
+
+        sgraph.snode_list = snode_list
+        sgraph.snodes = dict(zip(fullnames, snode_list))
+        sgraph.snode_ids = dict(zip(fullnames, range(len(fullnames))))
+
+        (num_types,), pos = _read_array(view, pos)
+        for _ in range(num_types):
+            (type_idx,), pos = _read_array(view, pos)
+            edge_arrays = []
+            for _ in range(5):
+                arr, pos = _read_array(view, pos)
+                edge_arrays.append(arr)
+            columns = sgraph.edge_columns[SEDGE_TYPES[type_idx]] = EdgeColumns.from_arrays(*edge_arrays)
+            columns.columns, pos = _read_attr_columns(view, pos, values)
+        return sgraph
+
     def visualize(self, output_filename='../_', im_format='png', view=False) -> None:
         """
         visualize sgraph using graphviz
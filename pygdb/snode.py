@@ -1,9 +1,47 @@
 import ast
 from enum import Enum
-from typing import Optional, List, Dict, Union
+from itertools import repeat
+from typing import Optional, List, Dict, Tuple, Union
 
 
 class Dotstring(str):
+    """
+    dotted name, equal names are interned and share one object,
+    so they are stored once and compared by identity in dict lookups
+    """
+    __slots__ = ()
+
+    # {name: its interned Dotstring}
+    interned: Dict[str, 'Dotstring'] = {}
+
+    # {name: (wo_last, last)}, filled when first needed
+    parts: Dict[str, Tuple['Dotstring', 'Dotstring']] = {}
+
+    def __new__(cls, value=''):
+        interned = cls.interned.get(value)
+        if interned is None:
+            interned = str.__new__(cls, value)
+            interned = cls.interned.setdefault(interned, interned)
+        return interned
+
+    @classmethod
+    def intern_all(cls, strings: List[str]) -> List['Dotstring']:
+        """
+        Dotstring of each of strings, in bulk
+        """
+        interned = cls.interned
+        created = list(map(str.__new__, repeat(cls), strings))
+        return list(map(interned.setdefault, created, created))
+
+    @classmethod
+    def clear_interned(cls) -> None:
+        """
+        forget all names, e.g. those of an earlier scan in the same process,
+        Dotstrings made before stay valid but are not shared with later ones
+        """
+        cls.interned.clear()
+        cls.parts.clear()
+
     def __getitem__(self, *args, **kwargs):
         return Dotstring(super().__getitem__(*args, **kwargs))
 
@@ -24,15 +62,21 @@ class Dotstring(str):
         idx = self.find('.')
         return self[idx+1:] if idx != -1 else Dotstring('')
 
+    def split_last(self) -> Tuple['Dotstring', 'Dotstring']:
+        parts = Dotstring.parts.get(self)
+        if parts is None:
+            ridx = self.rfind('.')
+            parts = (self[:ridx], self[ridx+1:]) if ridx != -1 else (Dotstring(''), self)
+            Dotstring.parts[self] = parts
+        return parts
+
     @property
     def last(self):
-        ridx = self.rfind('.')
-        return self[ridx+1:] if ridx != -1 else self
+        return self.split_last()[1]
 
     @property
     def wo_last(self):
-        ridx = self.rfind('.')
-        return self[:ridx] if ridx != -1 else Dotstring('')
+        return self.split_last()[0]
 
     def concat(self, other):
         if self and other:
@@ -44,6 +88,15 @@ class Dotstring(str):
         else:
             return ''
 
+    def joined(self, other) -> str:
+        """
+        concat as a plain str, for lookups of names
+        that need not exist and should not be interned
+        """
+        if self and other:
+            return self + '.' + other
+        return self.concat(other)
+
     @staticmethod
     def from_list(li: List):
         return Dotstring('.'.join(li))
@@ -64,6 +117,13 @@ class SNodeType(Enum):
 
 
 class SNode:
+    # no per-instance __dict__, most snodes are plain names
+    # without attributes or bindings of their own
+    __slots__ = (
+        'fullname', 'name', 'namespace', 'modulename', 'packagename',
+        'snodetype', 'scope_dict', 'scope_parent', '_attrs'
+    )
+
     def __init__(
             self,
             fullname: Dotstring,
@@ -79,18 +139,33 @@ class SNode:
         self.fullname = fullname
         self.name = Dotstring(name) if name is not None else fullname.last
         self.namespace = namespace
-        self.modulename = modulename
-        self.packagename = packagename
+        # interned, shared by all snodes of a module
+        self.modulename = Dotstring(modulename) if modulename is not None else None
+        self.packagename = Dotstring(packagename) if packagename is not None else None
         self.snodetype = snodetype
 
-        # dictionary of {local_name: global_name} 
-        self.scope_dict = scope_dict
+        # dictionary of {local_name: global_name} for names bound in this scope,
+        # names bound in nested scopes are found through svisitor's ScopeIndex,
+        # snodes without bindings share NO_BINDINGS until ScopeIndex.bind replaces it
+        self.scope_dict = scope_dict if scope_dict else NO_BINDINGS
         
         # parent in context of scope
         self.scope_parent = scope_parent
 
-        # dictionary of other attributes
-        self.attrs = attrs
+        # dictionary of other attributes, None until there are any
+        self._attrs = attrs or None
+
+    @property
+    def attrs(self) -> Dict:
+        if self._attrs is None:
+            self._attrs = {}
+        return self._attrs
+
+    def get_attr(self, key, default=None):
+        """
+        attribute lookup that does not allocate attrs
+        """
+        return self._attrs.get(key, default) if self._attrs is not None else default
 
     def add_to_attrs(self, **new_attrs):
         self.attrs.update(new_attrs)
@@ -111,6 +186,12 @@ class SNode:
             'packageName': self.packagename,
         }
 
-        di.update({k: v for k, v in self.attrs.items() if not k.startswith('__')})
+        if self._attrs is not None:
+            for k, v in self._attrs.items():
+                if not k.startswith('__'):
+                    di[k] = v
         return di
 
+
+# shared empty scope, never updated in place
+NO_BINDINGS: Dict[Dotstring, Dotstring] = {}
@@ -0,0 +1,356 @@
+"""
+sources of the packages scanned by SVisitor,
+a directory on disk or the tree of a git commit read without a checkout
+"""
+from logging_settings import logger
+from ignore import IgnoreRules, DEFAULT_EXCLUDES
+
+import io
+import os
+from abc import ABC, abstractmethod
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path, PurePath, PurePosixPath
+from typing import Dict, Iterator, List, Sequence, Set, Tuple, Union
+
+REMOTE_PREFIXES = ('http://', 'https://', 'git@', 'ssh://', 'file://')
+
+# blobs fetched per git fetch when prefetching
+FETCH_CHUNK = 1000
+
+
+class SourceTree(ABC):
+    """
+    files of a package, paths are relative to its root,
+    excludes are .gitignore patterns relative to it
+    """
+    # name of the root package
+    name: str
+
+    def __init__(self, excludes: Sequence[str] = (), prefix: PurePosixPath = PurePosixPath()):
+        # rules match paths relative to the directory prefix (the root) is in,
+        # excludes take precedence over them
+        self.prefix = prefix
+        self.rules = IgnoreRules().extended(DEFAULT_EXCLUDES)
+        self.excludes = IgnoreRules().extended(excludes, prefix)
+        # directories listed, files in them, entries excluded, files read and their bytes,
+        # reads in summarize_modules workers are not counted
+        self.metrics: Dict[str, int] = dict.fromkeys(['dirs', 'files', 'excluded', 'reads', 'bytes'], 0)
+
+    @abstractmethod
+    def listdir(self, path: Union[str, PurePath]) -> List[Tuple[str, bool]]:
+        """
+        (name, is a directory) for the files and directories in path
+        """
+
+    @abstractmethod
+    def exists(self, path: Union[str, PurePath]) -> bool:
+        """
+        whether path is a file or directory of the package
+        """
+
+    @abstractmethod
+    def read(self, path: Union[str, PurePath]) -> str:
+        """
+        text of the file at path
+        """
+
+    def close(self) -> None:
+        pass
+
+    def ignored(self, path: PurePosixPath, is_dir: bool, rules: IgnoreRules | None = None) -> bool:
+        """
+        if path relative to the root is excluded, by self.rules unless other rules are given
+        """
+        path = self.prefix / path
+        if (excluded := self.excludes.match(path, is_dir)) is None:
+            excluded = (rules or self.rules).match(path, is_dir)
+        return bool(excluded)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FileSource(SourceTree):
+    """
+    directory on disk, crawled once before the traversal with os.scandir,
+    descending like the traversal only into directories with .py files
+    and skipping excluded entries, virtual environments and, if gitignore
+    is set, entries ignored by the .gitignore files of the repository,
+    the directories of a level are listed by threads in parallel
+    """
+    def __init__(self, root_dir: Union[str, Path], excludes: Sequence[str] = (), gitignore: bool = True, threads: int = 1):
+        self.root_path = Path(root_dir).resolve()
+        self.name = self.root_path.name
+        self.gitignore = gitignore
+        self.threads = threads
+
+        # rules match paths relative to the top of the repository,
+        # the .gitignore files between it and the root apply
+        top = self.root_path
+        if gitignore:
+            top = next((parent for parent in [self.root_path, *self.root_path.parents] if (parent / '.git').exists()), self.root_path)
+        super().__init__(excludes, PurePosixPath(self.root_path.relative_to(top).as_posix()))
+        for directory in reversed(self.prefix.parents):
+            self.rules = self.read_gitignore(self.rules, top / directory, directory)
+
+        # {directory: [(name, is a directory)]} after the crawl
+        self.listings: Dict[PurePosixPath, List[Tuple[str, bool]]] | None = None
+
+    def __str__(self):
+        return str(self.root_path)
+
+    def read_gitignore(self, rules: IgnoreRules, directory: Path, base: PurePosixPath) -> IgnoreRules:
+        if not self.gitignore or not (directory / '.gitignore').is_file():
+            return rules
+        with open(directory / '.gitignore', errors='replace') as file:
+            return rules.extended(file.readlines(), base)
+
+    def scan_dir(self, path: PurePosixPath) -> List[Tuple[str, bool]]:
+        """
+        entries of a directory, file types come from the cached DirEntry data
+        """
+        entries = []
+        with os.scandir(self.root_path / path) as scandir:
+            for entry in scandir:
+                if entry.is_file():
+                    entries.append((entry.name, False))
+                elif entry.is_dir():
+                    entries.append((entry.name, True))
+        return entries
+
+    def crawl(self) -> None:
+        self.listings = {}
+        venvs: Set[PurePosixPath] = set()
+        # directories to list with the .gitignore rules of their parent
+        level: List[Tuple[PurePosixPath, IgnoreRules]] = [(PurePosixPath(), self.rules)]
+
+        executor = ThreadPoolExecutor(max_workers=self.threads) if self.threads > 1 else None
+        try:
+            while level:
+                scanned = (executor.map if executor else map)(self.scan_dir, [path for path, _ in level])
+                next_level = []
+                for (path, rules), entries in zip(level, scanned):
+                    self.metrics['dirs'] += 1
+                    if path != PurePosixPath() and ('pyvenv.cfg', False) in entries:
+                        venvs.add(path)
+                        continue
+
+                    if ('.gitignore', False) in entries:
+                        rules = self.read_gitignore(rules, self.root_path / path, self.prefix / path)
+                    kept = [
+                        (name, is_dir) for name, is_dir in entries
+                        if not self.ignored(path / name, is_dir, rules)
+                    ]
+                    self.metrics['excluded'] += len(entries) - len(kept)
+                    self.metrics['files'] += sum(not is_dir for _, is_dir in kept)
+                    self.listings[path] = kept
+
+                    # the traversal only descends into directories with .py files
+                    if path == PurePosixPath() or any(name.endswith('.py') for name, _ in kept):
+                        next_level.extend((path / name, rules) for name, is_dir in kept if is_dir)
+                level = next_level
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        for venv in venvs:
+            self.listings[venv.parent].remove((venv.name, True))
+            self.metrics['excluded'] += 1
+
+    def listdir(self, path):
+        if self.listings is None:
+            self.crawl()
+        return self.listings[PurePosixPath(path)]
+
+    def exists(self, path):
+        path = PurePosixPath(path)
+        if self.listings is not None and path.parent in self.listings:
+            return any(name == path.name for name, _ in self.listings[path.parent])
+        return os.path.exists(self.root_path / path)
+
+    def read(self, path):
+        with open(self.root_path / path) as file:
+            self.metrics['reads'] += 1
+            self.metrics['bytes'] += os.fstat(file.fileno()).st_size
+            return file.read()
+
+
+class GitSource(SourceTree):
+    """
+    tree of a commit at relative within a git repository, listed once
+    and read blob by blob through one long-lived git cat-file --batch
+    """
+    def __init__(self, repo: Union[str, Path], rev: str = 'HEAD', relative: str = '.', name: str | None = None, excludes: Sequence[str] = ()):
+        super().__init__(excludes, PurePosixPath(relative))
+        self.repo = Path(repo).resolve()
+        self.commit = git(self.repo, 'rev-parse', '--verify', '--quiet', f'{rev}^{{commit}}').strip()
+        repo_name = self.repo.name[:-len('.git')] if self.repo.name.endswith('.git') else self.repo.name
+        self.name = self.prefix.name or name or repo_name
+
+        # {path: blob id} of files, {path: entries} of directories
+        self.blobs: Dict[PurePosixPath, str] = {}
+        self.dirs: Dict[PurePosixPath, List[Tuple[str, bool]]] = {PurePosixPath(): []}
+
+        # trees come before their contents, those of excluded trees are skipped
+        pruned: Set[PurePosixPath] = set()
+        pathspec = [] if self.prefix == PurePosixPath() else ['--', str(self.prefix)]
+        listing = git(self.repo, 'ls-tree', '-r', '-t', '-z', '--full-tree', self.commit, *pathspec)
+        for record in filter(None, listing.split('\0')):
+            meta, str_path = record.split('\t', 1)
+            mode, objtype, oid = meta.split()
+            path = PurePosixPath(str_path).relative_to(self.prefix)
+            if path == PurePosixPath():
+                continue
+            if path.parent in pruned or self.ignored(path, objtype == 'tree'):
+                if objtype == 'tree':
+                    pruned.add(path)
+                self.metrics['excluded'] += path.parent not in pruned
+                continue
+
+            if objtype == 'tree':
+                self.dirs.setdefault(path.parent, []).append((path.name, True))
+                self.dirs.setdefault(path, [])
+            elif objtype == 'blob' and mode != '120000':
+                # symbolic links and submodules are left out
+                self.dirs.setdefault(path.parent, []).append((path.name, False))
+                self.blobs[path] = oid
+
+        if self.prefix != PurePosixPath() and len(self.dirs) == 1 and not self.dirs[PurePosixPath()]:
+            raise FileNotFoundError(f'No directory {relative} in {self.repo} at {rev}')
+
+        # virtual environments
+        venvs = {path.parent for path in self.blobs if path.name == 'pyvenv.cfg' and path.parent != PurePosixPath()}
+        for venv in venvs:
+            self.dirs[venv.parent].remove((venv.name, True))
+            self.metrics['excluded'] += 1
+        if venvs:
+            self.blobs = {path: oid for path, oid in self.blobs.items() if venvs.isdisjoint(path.parents)}
+            self.dirs = {path: entries for path, entries in self.dirs.items() if path not in venvs and venvs.isdisjoint(path.parents)}
+        self.metrics['dirs'], self.metrics['files'] = len(self.dirs), len(self.blobs)
+        logger.info(f'Listed {len(self.blobs)} files of {self}.')
+
+        self.process: subprocess.Popen | None = None
+
+    def __str__(self):
+        return f'{self.repo}@{self.commit[:12]}:{self.prefix}'
+
+    def __getstate__(self):
+        # each process starts its own cat-file
+        return {**self.__dict__, 'process': None}
+
+    def listdir(self, path):
+        return self.dirs[PurePosixPath(path)]
+
+    def exists(self, path):
+        return PurePosixPath(path) in self.blobs or PurePosixPath(path) in self.dirs
+
+    def read(self, path):
+        oid = self.blobs[PurePosixPath(path)]
+        if self.process is None:
+            self.process = subprocess.Popen(['git', '-C', str(self.repo), 'cat-file', '--batch'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        self.process.stdin.write(oid.encode() + b'\n')
+        self.process.stdin.flush()
+        header = self.process.stdout.readline().split()
+        if len(header) != 3:
+            raise FileNotFoundError(f'Missing blob {oid} for {path} in {self}')
+        data = self.process.stdout.read(int(header[2]))
+        # trailing newline after the contents
+        self.process.stdout.read(1)
+        self.metrics['reads'] += 1
+        self.metrics['bytes'] += len(data)
+        # decoded as open() would, with universal newlines
+        return io.TextIOWrapper(io.BytesIO(data)).read()
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+
+    def missing_blobs(self, suffix: str = '.py') -> List[str]:
+        """
+        blobs ending in suffix not fetched yet in a partial clone
+        """
+        wanted = {oid for path, oid in self.blobs.items() if path.name.endswith(suffix)}
+        listing = git(self.repo, 'rev-list', '--objects', '--missing=print', self.commit)
+        return [line[1:] for line in listing.splitlines() if line.startswith('?') and line[1:] in wanted]
+
+
+def git(repo: Path, *args: str) -> str:
+    return subprocess.run(['git', '-C', str(repo), *args], check=True, capture_output=True).stdout.decode(errors='surrogateescape')
+
+
+def is_bare_repository(path: Path) -> bool:
+    return (path / 'HEAD').is_file() and (path / 'objects').is_dir()
+
+
+def fetch_source(uri: str, relative: str, rev: str | None, git_dir: Path, excludes: Sequence[str] = ()) -> GitSource:
+    """
+    shallow and blob-filtered fetch of rev into a bare repository at git_dir,
+    then a fetch of the .py blobs only, servers without filters
+    send all blobs, those refusing blobs by id leave them
+    to be fetched lazily by cat-file
+    """
+    repo_name = uri.rstrip('/').split('/')[-1]
+    if repo_name.endswith('.git'):
+        repo_name = repo_name[:-len('.git')]
+
+    logger.info(f'Fetching {uri}...')
+    git(git_dir, 'init', '--quiet', '--bare')
+    git(git_dir, 'remote', 'add', 'origin', uri)
+    git(git_dir, 'fetch', '--quiet', '--depth', '1', '--filter=blob:none', '--no-tags', 'origin', rev or 'HEAD')
+    source = GitSource(git_dir, 'FETCH_HEAD', relative, name=repo_name, excludes=excludes)
+
+    missing = source.missing_blobs()
+    try:
+        for start in range(0, len(missing), FETCH_CHUNK):
+            git(git_dir, 'fetch', '--quiet', '--no-tags', '--no-write-fetch-head', '--filter=blob:none', 'origin', *missing[start:start + FETCH_CHUNK])
+        logger.info(f'Fetched {len(missing)} blobs.')
+    except subprocess.CalledProcessError as e:
+        logger.warning(f'Failed to prefetch blobs, they are fetched one by one: {e.stderr.decode(errors="replace").strip()}')
+    return source
+
+
+@contextmanager
+def package_source(
+        uri: str,
+        relative: str,
+        rev: str | None = None,
+        excludes: Sequence[str] = (),
+        gitignore: bool = True,
+        threads: int = 1
+) -> Iterator[SourceTree]:
+    """
+    source of the package at relative within uri,
+    remote repositories are fetched into a temporary bare repository
+    removed afterwards and, like local bare repositories or any local
+    repository when rev is given, read from git without a checkout
+    gitignore and threads only apply to directories, whose files
+    are already filtered by git otherwise
+    """
+    if not uri.startswith(REMOTE_PREFIXES):
+        path = Path(uri)
+        if rev is None and not is_bare_repository(path):
+            yield FileSource(path / relative, excludes, gitignore, threads)
+            return
+        with GitSource(path, rev or 'HEAD', relative, excludes=excludes) as source:
+            yield source
+        return
+
+    with tempfile.TemporaryDirectory(prefix='pygdb-') as git_dir:
+        try:
+            source = fetch_source(uri, relative, rev, Path(git_dir), excludes)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f'Failed to fetch remote repository: {e.stderr.decode(errors="replace").strip()}')
+
+        with source:
+            yield source
+    logger.info('Cleanup complete.')
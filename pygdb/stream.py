@@ -0,0 +1,179 @@
+"""
+batches of an SGraph that is still being built,
+written while the rest of the package is scanned
+"""
+from sgraph import SGraph, SEdgeType
+from snode import SNode, SNodeType
+
+from array import array
+from itertools import repeat
+from typing import Dict, List, Set, Tuple, Sequence
+
+# (True, (snodetype, vars of nodes)) or (False, (sedgetype, first type, second type, edge_records))
+Batch = Tuple[bool, Tuple]
+
+
+class GraphStream:
+    """
+    a node is ready once the third pass of the module it belongs to has run,
+    an edge once both of its nodes were handed out, ready edges are collected
+    by type and types of their nodes and handed out in full batches,
+    edges added again after they were handed out are handed out again
+    by finish with their final count, and so are nodes whose attrs were
+    added to by later modules (e.g. the type of a.x annotated in b.py)
+    """
+    def __init__(self, sgraph: SGraph, batch_size: int):
+        self.sgraph = sgraph
+        self.batch_size = batch_size
+
+        # modules whose third pass has run
+        self.finished: Set[SNode] = set()
+
+        # nodes from next_sid on and rows from next_rows on were not looked at yet
+        self.next_sid = 0
+        self.next_rows: Dict[SEdgeType, int] = {}
+
+        # {module: ids of its nodes}, until its third pass has run
+        self.waiting_sids: Dict[SNode, List[int]] = {}
+        # {node id: (type, row) of edges waiting for it to be handed out}
+        self.waiting_rows: Dict[int, List[Tuple[SEdgeType, int]]] = {}
+
+        # ready to be handed out, by type of the node or the edge and its nodes
+        self.ready_sids: Dict[SNodeType, List[int]] = {}
+        self.ready_rows: Dict[Tuple[SEdgeType, SNodeType, SNodeType], List[int]] = {}
+
+        # 1 for each node handed out, by node id
+        self.handed_out = bytearray()
+        # ids of nodes handed out before attrs were added to them
+        self.updated_sids: Set[int] = set()
+        # count of each edge when it was handed out, 0 if it was not
+        self.handed_out_counts: Dict[SEdgeType, array] = {}
+
+    @staticmethod
+    def module_of(snode: SNode) -> SNode | None:
+        """
+        closest scope ancestor with a third pass
+        (a module or a package with __init__.py)
+        """
+        while snode is not None:
+            if snode.snodetype is SNodeType.Module or (snode.snodetype is SNodeType.Package and snode.get_attr('__hasinit__')):
+                return snode
+            snode = snode.scope_parent
+        return None
+
+    def module_done(self, module_snode: SNode) -> List[Batch]:
+        """
+        full batches that are ready after the third pass of module_snode,
+        nodes before the edges between them
+        """
+        self.finished.add(module_snode)
+        for sid in self.waiting_sids.pop(module_snode, ()):
+            self.ready_sids.setdefault(self.sgraph.snode_list[sid].snodetype, []).append(sid)
+        return self.batches(final=False)
+
+    def attrs_added(self, snode: SNode) -> None:
+        """
+        to be called when attrs are added to snode,
+        nodes handed out already are handed out again by finish
+        """
+        sid = self.sgraph.snode_ids.get(snode.fullname)
+        if sid is not None and sid < len(self.handed_out) and self.handed_out[sid]:
+            self.updated_sids.add(sid)
+
+    def finish(self) -> List[Batch]:
+        """
+        everything not handed out yet, then the nodes updated
+        and the edges counted again since they were
+        """
+        batches = self.batches(final=True)
+        snode_list = self.sgraph.snode_list
+        updated: Dict[SNodeType, List[int]] = {}
+        for sid in sorted(self.updated_sids):
+            updated.setdefault(snode_list[sid].snodetype, []).append(sid)
+        for snodetype, sids in updated.items():
+            for start in range(0, len(sids), self.batch_size):
+                batches.append((True, (snodetype, [vars(snode_list[sid]) for sid in sids[start:start + self.batch_size]])))
+        for sedgetype, handed_out_counts in self.handed_out_counts.items():
+            columns = self.sgraph.edge_columns[sedgetype]
+            recounted = [row for row, count in enumerate(handed_out_counts) if count and count != columns.counts[row]]
+            for (first_type, second_type), rows in self.sgraph.endpoint_groups(sedgetype, recounted).items():
+                batches.extend(self.edge_batches(sedgetype, first_type, second_type, rows))
+        return batches
+
+    def batches(self, final: bool) -> List[Batch]:
+        """
+        full batches of what is ready, everything if final
+        """
+        snode_list = self.sgraph.snode_list
+        self.handed_out.extend(bytes(len(snode_list) - len(self.handed_out)))
+
+        for sid in range(self.next_sid, len(snode_list)):
+            snode = snode_list[sid]
+            module_snode = self.module_of(snode)
+            if module_snode is None or module_snode in self.finished:
+                self.ready_sids.setdefault(snode.snodetype, []).append(sid)
+            else:
+                self.waiting_sids.setdefault(module_snode, []).append(sid)
+        self.next_sid = len(snode_list)
+        if final:
+            for sids in self.waiting_sids.values():
+                for sid in sids:
+                    self.ready_sids.setdefault(snode_list[sid].snodetype, []).append(sid)
+            self.waiting_sids.clear()
+
+        # nodes of all types are handed out together once there are a batch worth,
+        # edges of types with few nodes would wait for the end otherwise
+        batches: List[Batch] = []
+        if final or sum(map(len, self.ready_sids.values())) >= self.batch_size:
+            for snodetype, sids in self.ready_sids.items():
+                for start in range(0, len(sids), self.batch_size):
+                    chunk = sids[start:start + self.batch_size]
+                    batches.append((True, (snodetype, [vars(snode_list[sid]) for sid in chunk])))
+                    for sid in chunk:
+                        self.hand_out_snode(sid)
+            self.ready_sids.clear()
+
+        for sedgetype, columns in self.sgraph.edge_columns.items():
+            for row in range(self.next_rows.get(sedgetype, 0), len(columns)):
+                self.place_edge(sedgetype, row)
+            self.next_rows[sedgetype] = len(columns)
+
+        for (sedgetype, first_type, second_type), rows in self.ready_rows.items():
+            end = len(rows) if final else len(rows) - len(rows) % self.batch_size
+            if not end:
+                continue
+            columns = self.sgraph.edge_columns[sedgetype]
+            handed_out_counts = self.handed_out_counts.setdefault(sedgetype, array('q'))
+            handed_out_counts.extend(repeat(0, len(columns) - len(handed_out_counts)))
+            for row in rows[:end]:
+                handed_out_counts[row] = columns.counts[row]
+            batches.extend(self.edge_batches(sedgetype, first_type, second_type, rows[:end]))
+            del rows[:end]
+        return batches
+
+    def hand_out_snode(self, sid: int) -> None:
+        self.handed_out[sid] = 1
+        for sedgetype, row in self.waiting_rows.pop(sid, ()):
+            self.place_edge(sedgetype, row)
+
+    def place_edge(self, sedgetype: SEdgeType, row: int) -> None:
+        """
+        make the edge ready if both of its nodes were handed out,
+        otherwise let it wait for one that was not
+        """
+        columns = self.sgraph.edge_columns[sedgetype]
+        src, dst = columns.src[row], columns.dst[row]
+        for sid in (src, dst):
+            if not self.handed_out[sid]:
+                self.waiting_rows.setdefault(sid, []).append((sedgetype, row))
+                return
+
+        snode_list = self.sgraph.snode_list
+        key = (sedgetype, snode_list[src].snodetype, snode_list[dst].snodetype)
+        self.ready_rows.setdefault(key, []).append(row)
+
+    def edge_batches(self, sedgetype: SEdgeType, first_type: SNodeType, second_type: SNodeType, rows: Sequence[int]) -> List[Batch]:
+        return [
+            (False, (sedgetype, first_type, second_type, self.sgraph.edge_records(sedgetype, rows[start:start + self.batch_size])))
+            for start in range(0, len(rows), self.batch_size)
+        ]
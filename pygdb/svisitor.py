@@ -1,19 +1,115 @@
 from logging_settings import logger
-from sgraph import SEdgeType, SEdge, SGraph
+from sgraph import SEdgeType, SGraph
 from snode import SNodeType, SNode, Dotstring
+from cache import SummaryCache
+from ast_symtable import ast_symbols, is_supported
+from import_order import strongly_connected_components, dependency_levels
+from scope import ScopeIndex
+from sources import SourceTree, FileSource
+from profiling import ScanProfile
 
 import ast
 import symtable
 from collections import deque
-from typing import List, Dict, Deque, Tuple, Union, Set
-import os
+from typing import List, Dict, Deque, Tuple, Union, Set, Callable
 import sys
-import tracemalloc
-import traceback
 import time
+import traceback
 import pathlib
 import builtins
 from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import pickle
+
+
+# span of an AST node, used as its key across processes
+Span = Tuple[int, int, int, int]
+
+
+def node_span(node: ast.AST) -> Span:
+    return node.lineno, node.col_offset, node.end_lineno, node.end_col_offset
+
+
+def summarize_symbols(table: symtable.SymbolTable) -> Tuple[List[str], List[Tuple[str, str, Tuple]]]:
+    """
+    compact form of a symbol table, i.e.
+        ([local names], [(child name, child type, child summary)])
+    """
+    names = [symbol.get_name() for symbol in table.get_symbols() if symbol.is_local() and not symbol.is_imported()]
+    children = [(child.get_name(), child.get_type(), summarize_symbols(child)) for child in table.get_children()]
+    return names, children
+
+
+def summarize_references(tree: ast.AST) -> List[Tuple]:
+    """
+    attribute chains and imports of a module in order of traversal,
+    as tuples of either
+        ('attr', relative namespace, name list, span)
+        ('import', module name, level)
+    """
+    events: List[Tuple] = []
+
+    fp_stack: Deque[Tuple[Dotstring, ast.AST]] = deque()
+    fp_stack.append((Dotstring(''), tree,))
+
+    while fp_stack:
+        top_namespace, top_node = fp_stack.pop()
+
+        if isinstance(top_node, ast.Attribute):
+            name_list = []
+            node = top_node
+
+            while isinstance(node, ast.Attribute):
+                name_list.append(node.attr)
+                node = node.value
+
+            # name_list.append(node.id) if hasattr(node, 'id') else 1  # doesnt need to end with name !?
+            if hasattr(node, 'id'):
+                name_list.append(node.id)
+            else:
+                continue
+
+            events.append(('attr', top_namespace, name_list[::-1], node_span(top_node)))
+
+        elif isinstance(top_node, (ast.Import, ast.ImportFrom, )):
+            names_list = [name.name for name in top_node.names] if isinstance(top_node, ast.Import) else [top_node.module]
+            level = top_node.level if isinstance(top_node, ast.ImportFrom) else None
+
+            for name in names_list:
+                events.append(('import', name, level))
+
+        else:
+            new_namespace = top_namespace
+            if isinstance(top_node, ast.ClassDef) or isinstance(top_node, ast.FunctionDef):
+                # set new namespace
+                new_namespace = new_namespace.concat(top_node.name)
+
+            # add children
+            for child in ast.iter_child_nodes(top_node):
+                fp_stack.append((new_namespace, child))
+
+    return events
+
+
+def summarize_module(code: str, filepath: Union[str, pathlib.Path]) -> Tuple[Tuple, List[Tuple]]:
+    """
+    symbols (first pass) and references (second pass) of a module,
+    does not depend on the SGraph so it can run in a worker process
+    """
+    tree = ast.parse(code)
+    return module_symbols(tree, code, filepath), summarize_references(tree)
+
+
+def module_symbols(tree: ast.Module, code: str, filepath: Union[str, pathlib.Path]) -> Tuple:
+    """
+    summary of the symbol table of a module, taken from its AST
+    on Python versions where this matches symtable
+    """
+    if is_supported():
+        return ast_symbols(tree)
+    table = symtable.symtable(code, filepath, compile_type='exec')
+    return summarize_symbols(table)
 
 
 class SVisitor:
@@ -22,53 +118,154 @@ class SVisitor:
     """
     def __init__(self):
         self.sgraph: SGraph = SGraph()
+
+        # scopes of all snodes, see propagate_scope
+        self.scopes = ScopeIndex()
         self.stack: Deque[Tuple[Dotstring, ast.AST]] = deque()
         self.root_namespace = None
+        # package scanned, module paths are relative to its root
+        self.source: SourceTree | None = None
+
+        # third pass changes are recorded here if not None
+        self.journal: List[Tuple] | None = None
+        # called with each snode attrs are added to, e.g. to write it again, see GraphStream
+        self.on_attrs: Callable[[SNode], None] | None = None
+
+        # line of the node handled in the third pass, recorded on edges
+        self.lineno: int | None = None
+
+        # {'snodes': (added, removed), 'sedges': (added, removed)} after an incremental scan
+        self.delta: Dict[str, Tuple[Set, Set]] | None = None
+
+        # sources are read from disk when needed and ASTs dropped after the third pass
+        self.low_memory = False
+
+        # times and memory of the phases of the last scan
+        self.profile: ScanProfile | None = None
+
+        # modules of the third pass plan grouped by dependency level,
+        # modules on the same level do not import each other
+        self.import_levels: List[List[SNode]] = []
+
+        # {first block of a name relative to a package: {package snode: package rank}}
+        # for the keys of package scopes, used for absolute imports, packages are
+        # ranked in the depth-first order resolve_import used to search them in
+        self.module_index: Dict[str, Dict[SNode, int]] = {}
+        self.package_rank: Dict[SNode, int] = {}
+        # {module name: {(importing package, level): resolved snode}}
+        self.import_memo: Dict[str, Dict[Tuple[Dotstring, int], SNode | None]] = {}
+
+        # {name: {scope snode: fullname the name is bound to}} for resolve_name,
+        # entries of a name are dropped whenever a key ending in it is bound
+        self.name_cache: Dict[str, Dict[SNode, Dotstring]] = {}
+        self.resolve_stats: Dict[str, int] = {'calls': 0, 'hits': 0, 'misses': 0}
+
+    def scan_package(
+            self,
+            root_dir: Union[str, pathlib.Path, SourceTree],
+            jobs: int = 1,
+            state_path: Union[str, pathlib.Path, None] = None,
+            cache: SummaryCache | None = None,
+            low_memory: bool = False,
+            on_module: Callable[[SNode], None] | None = None,
+            profile: ScanProfile | None = None
+    ) -> None:
+        """
+        root_dir is a directory or any SourceTree, e.g. a git commit
+        if state_path is given, the scan is incremental: modules unchanged since the
+        scan that saved the state are not parsed again and the third pass is run only
+        for changed modules and modules importing them
+        if cache is given, module summaries are loaded from and saved to it
+        if low_memory is set, sources are not kept on the module snodes and
+        each module's AST only lives for the duration of its third pass
+        if on_module is given, it is called with each module snode after its third pass
+        if profile is given, phases and modules are recorded in it
+        """
+        profile = self.profile = ScanProfile() if profile is None else profile
+        profile.start()
+        try:
+            self.run_scan(root_dir, jobs, state_path, cache, low_memory, on_module)
+        finally:
+            # cProfile and the stack sampler only cover the scan, also if it fails
+            profile.stop()
 
-    def scan_package(self, root_dir: Union[str, pathlib.Path]) -> None:
-        tracemalloc.start()
-        start_time = time.perf_counter()
+        logger.info('Finished successfully')
+        logger.info(f'Constructed graph with {len(self.sgraph.snodes)} nodes and {len(self.sgraph.sedges)} edges.')
+        memory = 'traced peak' if profile.trace_memory else 'max RSS'
+        logger.info(f'Used {(profile.peak_memory() or 0) / 1024**2:.2f} MiB ({memory}) in {profile.elapsed():.2f} seconds.')
+        metrics = self.source.metrics
+        logger.info(f'Read {metrics["reads"]} files, {metrics["bytes"] / 1024**2:.2f} MiB.')
+        stats = self.resolve_stats
+        profile.details.update(
+            package=self.root_namespace,
+            graph={'nodes': len(self.sgraph.snodes), 'edges': len(self.sgraph.sedges)},
+            source=dict(metrics),
+            resolve=dict(stats),
+        )
+        logger.info(f'Resolved {stats["calls"]} names, {stats["hits"]} hits and {stats["misses"]} misses '
+                    f'({stats["hits"] / max(stats["calls"], 1):.1%} hit rate).')
+        logger.get_stats()
 
-        root_path = pathlib.Path(root_dir).resolve()
-        self.root_namespace = root_path.name
-        os.chdir(root_path)
-        logger.info(f'Scanning package at root location {root_path}')
+    def run_scan(
+            self,
+            root_dir: Union[str, pathlib.Path, SourceTree],
+            jobs: int,
+            state_path: Union[str, pathlib.Path, None],
+            cache: SummaryCache | None,
+            low_memory: bool,
+            on_module: Callable[[SNode], None] | None
+    ) -> None:
+        """
+        crawl and passes of scan_package, recorded in self.profile
+        """
+        profile = self.profile
+        self.low_memory = low_memory
+        # names of earlier scans in this process (e.g. a worker of add_many) are not kept alive
+        Dotstring.clear_interned()
+
+        def read(path) -> str | None:
+            return None if low_memory else source.read(path)
 
-        # path relative to root_path
-        def relpath(str_path):
-            return pathlib.Path(str_path).resolve().relative_to(root_path)
+        if state_path is not None:
+            state_path = pathlib.Path(state_path).resolve()
 
-        root_hasinit = os.path.exists('__init__.py')
+        # the working directory is left alone, several packages can be scanned at once
+        source = self.source = root_dir if isinstance(root_dir, SourceTree) else FileSource(root_dir)
+        self.root_namespace = source.name
+        logger.info(f'Scanning package at root location {source}')
+
+        root_hasinit = source.exists('__init__.py')
         root_snode = SNode(
             fullname=Dotstring(self.root_namespace),
             namespace=Dotstring(self.root_namespace),
             packagename=self.root_namespace,
             snodetype=SNodeType.Package,
-            scope_dict={self.root_namespace: self.root_namespace},
+            scope_dict={},
             __hasinit__=root_hasinit,
             __imports_from__=[],
-            __code__=open('__init__.py').read() if root_hasinit else None,
-            __filepath__=pathlib.Path('__init__.py') if os.path.exists('__init__.py') else '.'
+            __code__=read('__init__.py') if root_hasinit else None,
+            __filepath__=pathlib.Path('__init__.py') if root_hasinit else '.'
         )
         self.add_snodes(root_snode)
+        self.update_scope(root_snode, {self.root_namespace: self.root_namespace})
 
-        # stack to traverse directories
+        # stack to traverse directories, paths relative to the root
         stack: Deque[Tuple[SNode, pathlib.Path]] = deque()
-        stack.append((root_snode, root_path, ))
+        stack.append((root_snode, pathlib.Path(), ))
 
         # list of modules to analyze (and package = __init__)
-        module_list: Union[List[SNode], Set[SNode]] = [root_snode] if root_snode.attrs.get('__filepath__') != '.' else []
+        module_list: Union[List[SNode], Set[SNode]] = [root_snode] if root_snode.get_attr('__filepath__') != '.' else []
 
         while stack:
             package_snode, package_path = stack.pop()
-            logger.debug(f'Traversing files at {relpath(package_path)}')
+            logger.debug(f'Traversing files at {package_path}')
             # add folders and .py modules as children to package_snode
             # stop if a folder contains no .py files
 
             new_dict: Dict[Dotstring, Dotstring] = {}
 
-            for subpath in os.listdir(package_path):
-                if os.path.isfile(package_path/subpath) and subpath.endswith('.py') and subpath != '__init__.py':
+            for subpath, is_dir in source.listdir(package_path):
+                if not is_dir and subpath.endswith('.py') and subpath != '__init__.py':
                     # insert module node to graph and module_list
                     # propagate in scope_dict
                     # add to package's __imports_from__
@@ -82,27 +279,27 @@ class SVisitor:
                         scope_dict={},
                         scope_parent=package_snode,
                         __imports_from__=[],
-                        __code__=open(package_path/subpath).read(),
-                        __filepath__=relpath(package_path/subpath)
+                        __code__=read(package_path/subpath),
+                        __filepath__=package_path/subpath
                     )
 
                     logger.debug(f'Adding new module {module_snode.fullname}')
                     self.add_snodes(module_snode)
-                    self.add_sedges(SEdge((module_snode, package_snode, ), SEdgeType.WithinScope))
+                    self.add_sedge(module_snode, package_snode, SEdgeType.WithinScope)
 
                     module_list.append(module_snode)
                     new_dict[module_snode.fullname] = module_snode.fullname
 
                     package_snode.attrs.get('__imports_from__').append(module_snode)
-                    self.add_sedges(SEdge((package_snode, module_snode, ), SEdgeType.ImportsFrom))
+                    self.add_sedge(package_snode, module_snode, SEdgeType.ImportsFrom)
 
                 # add package if there are any .py files inside
-                elif os.path.isdir(package_path/subpath) and any([filename.endswith('.py') for filename in os.listdir(package_path/subpath)]):
+                elif is_dir and any([filename.endswith('.py') for filename, _ in source.listdir(package_path/subpath)]):
                     # add folder as package if it has any .py files
                     # then also add to stack
 
                     # check for __init__.py
-                    hasinit = os.path.exists(initpath := package_path/subpath/pathlib.Path('__init__.py'))
+                    hasinit = source.exists(initpath := package_path/subpath/pathlib.Path('__init__.py'))
 
                     new_package_snode = SNode(
                         fullname=package_snode.fullname.concat(subpath),
@@ -113,96 +310,229 @@ class SVisitor:
                         scope_parent=package_snode,
                         __hasinit__=hasinit,
                         __imports_from__=[],
-                        __code__=open(initpath).read() if hasinit else None,
-                        __filepath__=relpath(initpath) if hasinit else None
+                        __code__=read(initpath) if hasinit else None,
+                        __filepath__=initpath if hasinit else None
                     )
 
                     logger.debug(f'Adding new package {new_package_snode.fullname}')
                     self.add_snodes(new_package_snode)
-                    self.add_sedges(SEdge((new_package_snode, package_snode, ), SEdgeType.WithinScope))
+                    self.add_sedge(new_package_snode, package_snode, SEdgeType.WithinScope)
 
                     module_list.append(new_package_snode) if hasinit else 1
                     new_dict[new_package_snode.fullname] = new_package_snode.fullname
 
                     package_snode.attrs.get('__imports_from__').append(new_package_snode)
-                    self.add_sedges(SEdge((package_snode, new_package_snode, ), SEdgeType.ImportsFrom))
+                    self.add_sedge(package_snode, new_package_snode, SEdgeType.ImportsFrom)
 
                     stack.append((new_package_snode, package_path/subpath))
 
             self.propagate_scope(package_snode, new_dict)
 
-        logger.info('File traversal finished. Starting first pass.')
-        for module_snode in module_list:
-            self.first_pass(module_snode)
+        metrics = source.metrics
+        logger.info(f'File traversal finished, listed {metrics["files"]} files in {metrics["dirs"]} directories, '
+                    f'{metrics["excluded"]} entries excluded.')
+        self.build_module_index(root_snode)
+        self.end_phase('crawl')
+
+        # summaries are computed before the passes if they are to be saved,
+        # in low memory mode they replace the ASTs kept between passes
+        keep_summaries = state_path is not None or cache is not None or low_memory
+        if state_path is not None or cache is not None:
+            for module_snode in module_list:
+                module_snode.add_to_attrs(__contenthash__=hashlib.sha1(self.get_code(module_snode).encode()).hexdigest())
+
+        summaries = [(None, None)] * len(module_list)
+        if state_path is not None:
+            state = self.load_state(state_path)
+            summaries = [
+                previous.get('summary') if (previous := state['modules'].get(module_snode.fullname)) is not None and previous.get('hash') == module_snode.get_attr('__contenthash__') else (None, None)
+                for module_snode in module_list
+            ]
+            logger.info(f'{sum(summary[0] is not None for summary in summaries)}/{len(module_list)} modules unchanged since last scan.')
+
+        if cache is not None:
+            for idx, module_snode in enumerate(module_list):
+                if summaries[idx][0] is None and (summary := cache.get(module_snode.get_attr('__contenthash__'))) is not None:
+                    summaries[idx] = summary
+            logger.info(f'Loaded {cache.hits} summaries from cache at {cache.cache_dir}.')
+
+        missing = [idx for idx, summary in enumerate(summaries) if summary[0] is None]
+        if jobs > 1:
+            logger.info(f'Summarizing {len(missing)} modules with {jobs} jobs.')
+            for idx, summary in zip(missing, self.summarize_modules([module_list[idx] for idx in missing], jobs)):
+                summaries[idx] = summary
+        elif keep_summaries:
+            for idx in missing:
+                module_snode = module_list[idx]
+                with profile.module(module_snode.fullname, 'summary'):
+                    code = self.get_code(module_snode)
+                    tree = ast.parse(code)
+                    if not low_memory:
+                        # keep the tree for the third pass
+                        module_snode.add_to_attrs(__ast__=tree)
+                    summaries[idx] = module_symbols(tree, code, module_snode.get_attr('__filepath__')), summarize_references(tree)
+
+        if cache is not None:
+            for idx in missing:
+                cache.put(module_list[idx].get_attr('__contenthash__'), summaries[idx])
+            cache.evict()
+        self.end_phase('summaries')
+
+        logger.info('Starting first pass.')
+        for module_snode, (symbols, _) in zip(module_list, summaries):
+            with profile.module(module_snode.fullname, 'first pass'):
+                self.first_pass(module_snode, symbols)
         logger.info('First passes finished. Starting second pass.')
-        for module_snode in module_list:
-            self.second_pass(module_snode)
+        self.end_phase('first pass')
+        for module_snode, (_, references) in zip(module_list, summaries):
+            with profile.module(module_snode.fullname, 'second pass'):
+                self.second_pass(module_snode, references)
         logger.info('Second passes finished. Setting up plan for third pass.')
+        self.end_phase('second pass')
 
-        sys.setrecursionlimit(50000)
-        # get ordering of modules based on imports
-        seen_set = set()
-        new_module_list = []
-
-        def rec(snode: SNode):
-            if snode in seen_set:
-                return
-            else:
-                seen_set.add(snode)
-
-            for imported_snode in snode.attrs.get('__imports_from__'):
-                rec(imported_snode)
-
-            if snode.snodetype is SNodeType.Module or snode.attrs.get('__hasinit__') and snode not in new_module_list:
-                new_module_list.append(snode)
+        # module_list is reordered below
+        if state_path is not None:
+            summary_dict = {module_snode.fullname: summary for module_snode, summary in zip(module_list, summaries)}
+        del summaries
 
-        rec(root_snode)
+        # get ordering of modules based on imports,
+        # import cycles are condensed so that dependencies come first
+        planned = set(module_list)
+        components = strongly_connected_components([root_snode, *module_list], self.imported_snodes)
+        levels = dependency_levels(components, self.imported_snodes)
 
-        if len(module_list) != len(new_module_list):
-            # known to happen from: Python2 scripts, docstring-only modules
-            diff = set(module_list) - set(new_module_list) if len(module_list) > len(new_module_list) else set(new_module_list) - set(module_list)
-            message = f'Not all modules in list for third pass ({len(module_list)} != {len(new_module_list)})\n{diff=}.'
-            # raise Exception(message)
-            logger.critical(message)
+        new_module_list = []
+        self.import_levels = []
+        for component, level in zip(components, levels):
+            component = [snode for snode in component if snode in planned]
+            new_module_list.extend(component)
+            while len(self.import_levels) <= level:
+                self.import_levels.append([])
+            self.import_levels[level].extend(component)
+        self.import_levels = [level for level in self.import_levels if level]
+
+        cycles = [component for component in components if len(component) > 1]
+        logger.info(f'{len(components)} import components, {len(cycles)} of them cycles, in {len(self.import_levels)} dependency levels.')
+        for component in cycles:
+            logger.debug(f'Import cycle: {[snode.fullname for snode in component]}')
 
         module_list = new_module_list
+        self.end_phase('planning')
 
         logger.info(f'Plan set ({len(module_list)} modules). Starting third pass.')
-        for module_snode in module_list:
-            self.third_pass(module_snode)
+        if state_path is None:
+            for module_snode in module_list:
+                with profile.module(module_snode.fullname, 'third pass'):
+                    self.third_pass(module_snode)
+                if low_memory:
+                    self.release(module_snode)
+                if on_module is not None:
+                    on_module(module_snode)
+        else:
+            affected = self.affected_modules(state)
+            journals = {}
+            rerun_count = 0
+            for module_snode in module_list:
+                journal = state['modules'].get(module_snode.fullname, {}).get('journal')
+                with profile.module(module_snode.fullname, 'third pass'):
+                    if module_snode.fullname not in affected and journal is not None and self.can_replay(journal):
+                        self.replay(journal)
+                    else:
+                        self.journal = journal = []
+                        self.third_pass(module_snode)
+                        self.journal = None
+                        rerun_count += 1
+                journals[module_snode.fullname] = journal
+                if low_memory:
+                    self.release(module_snode)
+                if on_module is not None:
+                    on_module(module_snode)
+
+            self.save_state(state_path, state, module_list, summary_dict, journals)
+            logger.info(f'Third pass run for {rerun_count}/{len(module_list)} modules.')
+            logger.info(
+                f'Delta: +{len(self.delta["snodes"][0])}/-{len(self.delta["snodes"][1])} nodes, '
+                f'+{len(self.delta["sedges"][0])}/-{len(self.delta["sedges"][1])} edges.'
+            )
+
+        self.end_phase('third pass')
+
+    @staticmethod
+    def imported_snodes(snode: SNode) -> List[SNode]:
+        return snode.get_attr('__imports_from__') or []
+
+    def end_phase(self, phase: str) -> None:
+        """
+        record and log the time of a scan phase, and its peak memory if traced,
+        then start measuring the next one
+        """
+        record = self.profile.end_phase(phase)
+        logger.info(f'Finished {phase} in {record["wall"]:.2f} seconds ({record["cpu"]:.2f} s CPU).')
+        if 'traced_peak' in record:
+            logger.info(f'Peak memory during {phase}: {record["traced_peak"] / 1024**2:.2f} MiB (currently {record["traced_current"] / 1024**2:.2f} MiB).')
 
-        end_time = time.perf_counter()
-        logger.info('Finished successfully')
-        logger.info(f'Constructed graph with {len(self.sgraph.snodes)} nodes and {len(self.sgraph.sedges)} edges.')
-        logger.info(f'Used {tracemalloc.get_traced_memory()[1] / 1024**2:.2f} MiB in {end_time - start_time:.2f} seconds.')
-        logger.get_stats()
+    def get_code(self, module_snode: SNode) -> str | None:
+        """
+        source of a module, read from the package source in low memory mode
+        """
+        code = module_snode.get_attr('__code__')
+        if code is None and self.low_memory and module_snode.get_attr('__filepath__') not in (None, '.'):
+            code = self.source.read(module_snode.get_attr('__filepath__'))
+        return code
 
-    def first_pass(self, module_snode: SNode) -> None:
+    @staticmethod
+    def release(module_snode: SNode) -> None:
+        """
+        drop the parts of a module snode only needed until its third pass
+        """
+        module_snode.attrs.pop('__ast__', None)
+        module_snode.attrs.pop('__name_dotstrings__', None)
+
+    def summarize_modules(self, module_list: List[SNode], jobs: int) -> List[Tuple]:
+        """
+        run parsing and symbol extraction in a process pool,
+        summaries are returned in order of module_list
+        """
+        codes = [module_snode.get_attr('__code__') for module_snode in module_list]
+        filepaths = [module_snode.get_attr('__filepath__') for module_snode in module_list]
+        chunksize = max(1, len(module_list) // (4 * jobs))
+
+        # the source is sent once to each worker
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_set_worker_source, initargs=(self.source, )) as executor:
+            summaries = []
+            for module_snode, (summary, seconds) in zip(module_list, executor.map(_summarize_module_or_none, codes, filepaths, chunksize=chunksize)):
+                # timed in the worker, so that the report covers parsing with any number of jobs
+                self.profile.record_module(module_snode.fullname, 'summary', seconds)
+                summaries.append(summary or (None, None))
+            return summaries
+
+    def first_pass(self, module_snode: SNode, symbols: Tuple | None = None) -> None:
         logger.info(f'First pass for {module_snode.fullname}')
-        code = module_snode.attrs.get('__code__')
-        if code is None:
-            logger.debug(f'No code for module/package {module_snode.fullname}')
-            return
+        if symbols is None:
+            code = self.get_code(module_snode)
+            if code is None:
+                logger.debug(f'No code for module/package {module_snode.fullname}')
+                return
 
-        table = symtable.symtable(code, module_snode.attrs.get('__filepath__'), compile_type='exec')
+            tree = ast.parse(code)
+            # parsed once, reused by the second and third pass
+            module_snode.add_to_attrs(__ast__=tree)
+            symbols = module_symbols(tree, code, module_snode.get_attr('__filepath__'))
         module_name = module_snode.name
 
-        symbol_stack: Deque[Tuple[symtable.SymbolTable, SNode]] = deque()
+        symbol_stack: Deque[Tuple[Tuple, SNode]] = deque()
 
         # traverse symbol table
-        symbol_stack.append((table, module_snode,))
+        symbol_stack.append((symbols, module_snode,))
         while symbol_stack:
-            top_table, top_snode = symbol_stack.pop()
+            (names, children), top_snode = symbol_stack.pop()
             logger.debug(f'Checking symbols in namespace {top_snode.fullname}')
 
             new_dict = {}
-            for symbol in top_table.get_symbols():
-                if not symbol.is_local() or symbol.is_imported():
-                    continue
-
+            for name in names:
                 new_snode = SNode(
-                    fullname=top_snode.fullname.concat(symbol.get_name()),
-                    name=symbol.get_name(),
+                    fullname=top_snode.fullname.concat(name),
+                    name=name,
                     namespace=top_snode.fullname,
                     modulename=module_name,
                     packagename=module_snode.packagename,
@@ -213,59 +543,46 @@ class SVisitor:
 
                 new_dict[new_snode.fullname] = new_snode.fullname
                 self.add_snodes(new_snode)
-                self.add_sedges(SEdge(
-                    (new_snode, top_snode),
-                    SEdgeType.WithinScope
-                ))
+                self.add_sedge(new_snode, top_snode, SEdgeType.WithinScope)
                 logger.debug(f'Added symbol {new_snode.name}')
 
             # propagate all new names to own scope and parents' scopes
             self.propagate_scope(top_snode, new_dict)
 
             # add children to stack if Function or Class
-            for child in top_table.get_children():
-                child_fullname = top_snode.get_local(child.get_name())
+            for child_name, child_type, child_symbols in children:
+                child_fullname = top_snode.get_local(child_name)
                 if child_fullname is None:  # unknown error cause?
                     logger.error(f'Child {child_fullname} in {module_snode.fullname} could not be resolved')
                     continue
                 child_snode = self.get_snode(child_fullname)
-                child_snode.snodetype = SNodeType.Function if child.get_type() == 'function' else SNodeType.Class
-                symbol_stack.append((child, child_snode,))
+                self.sgraph.set_snodetype(child_snode, SNodeType.Function if child_type == 'function' else SNodeType.Class)
+                symbol_stack.append((child_symbols, child_snode,))
                 logger.debug(f'Added to stack {child_snode}')
 
-    def second_pass(self, module_snode: SNode) -> None:
+    def second_pass(self, module_snode: SNode, references: List[Tuple] | None = None) -> None:
         logger.info(f'Starting second pass for file {module_snode.fullname} (package: {module_snode.packagename})')
-        code = module_snode.attrs.get('__code__')
-        if code is None:
-            logger.debug(f'No code for module/package {module_snode.fullname}')
-            return
-
-        tree = ast.parse(code)
-        module_snode.add_to_attrs(__ast__=tree)
-
-        fp_stack: Deque[Tuple[Dotstring, ast.AST]] = deque()
-        module_snode.ast_node = tree
-        fp_stack.append((module_snode.fullname, tree,))
-
-        while fp_stack:
-            top_namespace, top_node = fp_stack.pop()
-
-            if isinstance(top_node, ast.Attribute):
+        if references is None:
+            tree = module_snode.get_attr('__ast__')  # AST saved in first pass
+            if tree is None:
+                code = self.get_code(module_snode)
+                if code is None:
+                    logger.debug(f'No code for module/package {module_snode.fullname}')
+                    return
+                tree = ast.parse(code)
+                module_snode.add_to_attrs(__ast__=tree)
+            references = summarize_references(tree)
+
+        # {span of Attribute node: name dotstring} for chains handled here,
+        # the third pass does not analyze these again
+        name_dotstrings: Dict[Span, Dotstring] = {}
+        module_snode.add_to_attrs(__name_dotstrings__=name_dotstrings)
+
+        for reference in references:
+            if reference[0] == 'attr':
                 # handle attribute case
-                name_list = []
-                node = top_node
-
-                while isinstance(node, ast.Attribute):
-                    name_list.append(node.attr)
-                    node = node.value
-
-                # name_list.append(node.id) if hasattr(node, 'id') else 1  # doesnt need to end with name !?
-                if hasattr(node, 'id'):
-                    name_list.append(node.id)
-                else:
-                    continue
-
-                name_list = name_list[::-1]
+                _, relative_namespace, name_list, span = reference
+                top_namespace = module_snode.fullname.concat(relative_namespace)
 
                 if self.get_snode(top_namespace) is None:  # ?
                     logger.error(f'{top_namespace} snode could not be found.')
@@ -286,7 +603,7 @@ class SVisitor:
 
                 top_namespace = top_snode.namespace.concat(name_list[0])
                 # if this an "attribute" of module or package, do nothing
-                if top_namespace not in module_snode.scope_dict:
+                if not self.scopes.contains(module_snode, top_namespace):
                     continue
 
                 for name in name_list[1:]:
@@ -311,8 +628,7 @@ class SVisitor:
                         self.add_snodes(new_snode)
 
                         # connect with 'AttributeOf' SEdge
-                        new_sedge = SEdge((new_snode, top_snode), SEdgeType.AttributeOf)
-                        self.add_sedges(new_sedge)
+                        self.add_sedge(new_snode, top_snode, SEdgeType.AttributeOf)
 
                         # propagate in scope
                         self.propagate_scope(top_snode, {new_snode.fullname: new_snode.fullname})
@@ -321,38 +637,25 @@ class SVisitor:
                     top_namespace = top_namespace.concat(name)
                     top_snode = new_snode
 
-                # add the list to AST node
-                # top_node.name_list = name_list
-                top_node.name_dotstring = Dotstring.from_list(name_list)
+                # mark the AST node as analyzed
+                name_dotstrings[span] = Dotstring.from_list(name_list)
 
             # import handling in second pass
             # what about a package wo __init__?
-            elif isinstance(top_node, (ast.Import, ast.ImportFrom, )):
-                names_list = [name.name for name in top_node.names] if isinstance(top_node, ast.Import) else [top_node.module]
-
-                for name in names_list:
-                    if name is None:  # ?
-                        logger.error(f'None node detected in module {module_snode.fullname}, {names_list}')
-                        continue
+            else:
+                _, name, level = reference
 
-                    level = top_node.level if isinstance(top_node, ast.ImportFrom) else None
-                    imported_snode = self.resolve_import(module_snode, name, level)
+                if name is None:  # ?
+                    logger.error(f'None node detected in module {module_snode.fullname}, {[name]}')
+                    continue
 
-                    if imported_snode is not None:
-                        logger.debug(f'Import detected in second pass: {module_snode} <- {imported_snode}')
-                        if imported_snode not in module_snode.attrs.get('__imports_from__'):
-                            module_snode.attrs.get('__imports_from__').append(imported_snode)
-                            self.add_sedges(SEdge((imported_snode, module_snode, ), SEdgeType.ImportsFrom))
+                imported_snode = self.resolve_import(module_snode, name, level)
 
-            else:
-                new_namespace = top_namespace
-                if isinstance(top_node, ast.ClassDef) or isinstance(top_node, ast.FunctionDef):
-                    # set new namespace
-                    new_namespace = new_namespace.concat(top_node.name)
-
-                # add children
-                for child in ast.iter_child_nodes(top_node):
-                    fp_stack.append((new_namespace, child))
+                if imported_snode is not None:
+                    logger.debug(f'Import detected in second pass: {module_snode} <- {imported_snode}')
+                    if imported_snode not in module_snode.get_attr('__imports_from__'):
+                        module_snode.attrs.get('__imports_from__').append(imported_snode)
+                        self.add_sedge(imported_snode, module_snode, SEdgeType.ImportsFrom)
 
     def third_pass(self, module_snode: SNode) -> None:
         """
@@ -383,17 +686,18 @@ class SVisitor:
 
                 # add to module's scope dict the imported scope dict, with adequate name changes
                 new_dict = {}
-                for local_fullname, true_fullname in imported_snode.scope_dict.items():
+                alias_fullname = top_snode.fullname.concat(alias)
+                for local_fullname, true_fullname in self.scopes.items(imported_snode):
                     # local_snode = self.get_snode(local_fullname)
                     local_snode = self.get_snode(true_fullname)
                     if local_snode is None:
                         logger.warning(f'{local_snode} could not be imported')
                         continue
 
-                    new_dict[top_snode.fullname.concat(alias).concat(local_snode.name)] = true_fullname
+                    new_dict[alias_fullname.concat(local_snode.name)] = true_fullname
 
-                self.add_sedges(SEdge((imported_snode, top_snode), SEdgeType.ImportedTo, alias=alias))
-                top_snode.scope_dict.update(new_dict)
+                self.add_sedge(imported_snode, top_snode, SEdgeType.ImportedTo, alias=alias)
+                self.update_scope(top_snode, new_dict)
         handlers_dict[ast.Import] = import_handler
 
         def importfrom_handler():
@@ -414,7 +718,7 @@ class SVisitor:
                 if source_name == '*':
                     # implementation for
                     # from ... import *
-                    for local_fullname, true_fullname in imported_snode.scope_dict.items():
+                    for local_fullname, true_fullname in self.scopes.items(imported_snode):
                         # local_snode = self.get_snode(local_fullname)
                         local_snode = self.get_snode(true_fullname)
                         if local_snode is None:
@@ -423,46 +727,46 @@ class SVisitor:
 
                         new_dict[top_snode.fullname.concat(local_snode.name)] = true_fullname
                 else:
-                    true_fullname = imported_snode.scope_dict.get(imported_snode.fullname.concat(source_name))
+                    true_fullname = self.scopes.get(imported_snode, imported_snode.fullname.concat(source_name))
                     if true_fullname is None:
                         logger.warning(f'{imported_snode.fullname.concat(source_name)} could not be found in scope of {imported_snode}')
                         continue
                     new_dict[top_snode.fullname.concat(alias)] = true_fullname
-                    self.add_sedges(SEdge((self.get_snode(true_fullname), top_snode, ), SEdgeType.ImportedTo, alias=alias))
-            top_snode.scope_dict.update(new_dict)
+                    self.add_sedge(self.get_snode(true_fullname), top_snode, SEdgeType.ImportedTo, alias=alias)
+            self.update_scope(top_snode, new_dict)
         handlers_dict[ast.ImportFrom] = importfrom_handler
 
         def classdef_handler():
             class_snode = self.get_snode(top_snode.fullname.concat(curr_node.name))
-            class_snode.add_to_attrs(docstring=ast.get_docstring(curr_node))
+            self.add_to_attrs(class_snode, docstring=ast.get_docstring(curr_node))
 
             for decorator in curr_node.decorator_list:
                 decorator_name = resolve_attrs_subhandler(decorator)
                 decorator_snode = self.resolve_name(top_snode, decorator_name)
                 if decorator_snode is not None:
-                    self.add_sedges(SEdge((decorator_snode, class_snode, ), SEdgeType.Decorates))
+                    self.add_sedge(decorator_snode, class_snode, SEdgeType.Decorates)
 
             for base in curr_node.bases:
                 base_name = resolve_attrs_subhandler(base)
                 base_snode = self.resolve_name(top_snode, base_name)
                 if base_snode is not None:
-                    self.add_sedges(SEdge((class_snode, base_snode, ), SEdgeType.InheritsFrom))
+                    self.add_sedge(class_snode, base_snode, SEdgeType.InheritsFrom)
 
             add_body_subhandler(class_snode)
         handlers_dict[ast.ClassDef] = classdef_handler
 
         def functiondef_handler():
             func_snode = self.get_snode(top_snode.fullname.concat(curr_node.name))
-            func_snode.add_to_attrs(docstring=ast.get_docstring(curr_node))
+            self.add_to_attrs(func_snode, docstring=ast.get_docstring(curr_node))
 
             if isinstance(curr_node, ast.AsyncFunctionDef):
-                func_snode.add_to_attrs(isAsync=True)
+                self.add_to_attrs(func_snode, isAsync=True)
 
             for decorator in curr_node.decorator_list:
                 decorator_name = resolve_attrs_subhandler(decorator)
                 decorator_snode = self.resolve_name(top_snode, decorator_name)
                 if decorator_snode is not None:
-                    self.add_sedges(SEdge((decorator_snode, func_snode, ), SEdgeType.Decorates))
+                    self.add_sedge(decorator_snode, func_snode, SEdgeType.Decorates)
 
             # handle return type
             type_node = curr_node.returns
@@ -480,13 +784,13 @@ class SVisitor:
                 arg_snode = self.get_snode(func_snode.fullname.concat(arg.arg))
                 # if arg_snode is not None:
                 #     # ??, in numpy e.g. is numpy.distutils.ccompiler.new_compiler which is defined
-                self.add_sedges(SEdge((arg_snode, func_snode), SEdgeType.Argument))
+                self.add_sedge(arg_snode, func_snode, SEdgeType.Argument)
 
                 typing_subhandler(arg_snode, arg.annotation)
 
             # mark as method if needed
             if func_snode.scope_parent.snodetype is SNodeType.Class:
-                self.add_sedges(SEdge((func_snode, func_snode.scope_parent), SEdgeType.Method))
+                self.add_sedge(func_snode, func_snode.scope_parent, SEdgeType.Method)
 
             add_body_subhandler(func_snode)
         handlers_dict[ast.FunctionDef] = functiondef_handler
@@ -507,11 +811,11 @@ class SVisitor:
                         if target_snode is None:
                             continue
 
-                        self.add_sedges(SEdge((target_snode, top_snode), SEdgeType.AssignedToWithin))
+                        self.add_sedge(target_snode, top_snode, SEdgeType.AssignedToWithin)
 
                         source_snodes = get_all_names_subhandler(_value)
                         for source_snode in source_snodes:
-                            self.add_sedges(SEdge((source_snode, target_snode), SEdgeType.AssignedTo))
+                            self.add_sedge(source_snode, target_snode, SEdgeType.AssignedTo)
                 elif isinstance(target, (ast.Attribute, ast.Name)):
                     target_name = resolve_attrs_subhandler(target)
                     target_snode = self.resolve_name(top_snode, target_name)
@@ -519,12 +823,12 @@ class SVisitor:
                     if target_snode is None:
                         continue
 
-                    self.add_sedges(SEdge((target_snode, top_snode), SEdgeType.AssignedToWithin))
+                    self.add_sedge(target_snode, top_snode, SEdgeType.AssignedToWithin)
 
                     source_snodes = get_all_names_subhandler(value)
 
                     for source_snode in source_snodes:
-                        self.add_sedges(SEdge((source_snode, target_snode), SEdgeType.AssignedTo))
+                        self.add_sedge(source_snode, target_snode, SEdgeType.AssignedTo)
         handlers_dict[ast.Assign] = assign_handler
 
         def annassign_handler():
@@ -539,7 +843,7 @@ class SVisitor:
             typing_subhandler(target_snode, annot)
             source_snodes = get_all_names_subhandler(value)
             for source_snode in source_snodes:
-                self.add_sedges(SEdge((source_snode, target_snode), SEdgeType.AssignedTo))
+                self.add_sedge(source_snode, target_snode, SEdgeType.AssignedTo)
         handlers_dict[ast.AnnAssign] = annassign_handler
 
         def namedexpr_handler():
@@ -553,7 +857,7 @@ class SVisitor:
 
             source_snodes = get_all_names_subhandler(value)
             for source_snode in source_snodes:
-                self.add_sedges(SEdge((source_snode, target_snode), SEdgeType.AssignedTo))
+                self.add_sedge(source_snode, target_snode, SEdgeType.AssignedTo)
         handlers_dict[ast.NamedExpr] = namedexpr_handler
 
         # def call_handler():
@@ -570,7 +874,7 @@ class SVisitor:
 
             source_snodes = get_all_names_subhandler(value)
             for source_snode in source_snodes:
-                self.add_sedges(SEdge((source_snode, top_snode), SEdgeType.Returns))
+                self.add_sedge(source_snode, top_snode, SEdgeType.Returns)
             pass
         handlers_dict[ast.Return] = return_handler
 
@@ -585,7 +889,7 @@ class SVisitor:
             snode = self.resolve_name(top_snode, name)
             if snode is None:
                 return
-            self.add_sedges(SEdge((snode, top_snode), SEdgeType.ReferencedWithin))
+            self.add_sedge(snode, top_snode, SEdgeType.ReferencedWithin)
         handlers_dict[ast.Name] = attrs_handler
         handlers_dict[ast.Attribute] = attrs_handler
 
@@ -597,9 +901,9 @@ class SVisitor:
         add_children_subhandler = default_handler
 
         def resolve_attrs_subhandler(top_node: ast.Name | ast.Attribute) -> Dotstring | None:
-            if hasattr(curr_node, 'name_dotstring'):
-                # already analyzed
-                return curr_node.name_dotstring
+            if isinstance(curr_node, ast.Attribute) and (span := node_span(curr_node)) in name_dotstrings:
+                # already analyzed in second pass
+                return name_dotstrings[span]
 
             name_list = []
             node = top_node
@@ -658,8 +962,7 @@ class SVisitor:
                     self.add_snodes(new_snode)
 
                     # connect with 'AttributeOf' SEdge
-                    new_sedge = SEdge((new_snode, referenced_snode), SEdgeType.AttributeOf)
-                    self.add_sedges(new_sedge)
+                    self.add_sedge(new_snode, referenced_snode, SEdgeType.AttributeOf)
 
                     # propagate in scope
                     self.propagate_scope(referenced_snode, {new_snode.fullname: new_snode.fullname})
@@ -672,7 +975,7 @@ class SVisitor:
             name = Dotstring.from_list(name_list)
             snode = self.resolve_name(top_snode, name)
             if snode is not None:
-                self.add_sedges(SEdge((snode, top_snode), SEdgeType.ReferencedWithin))
+                self.add_sedge(snode, top_snode, SEdgeType.ReferencedWithin)
 
             return name
 
@@ -680,12 +983,12 @@ class SVisitor:
             if top_node is None:
                 return
             if isinstance(top_node, ast.Name) and top_node.id in dir(builtins):
-                typed_snode.add_to_attrs(type=top_node.id)
+                self.add_to_attrs(typed_snode, type=top_node.id)
             else:
                 type_name = resolve_attrs_subhandler(top_node)
                 type_snode = self.resolve_name(top_snode, type_name)
                 if type_name is not None and type_snode is not None:
-                    self.add_sedges(SEdge((typed_snode, type_snode), SEdgeType.TypedWith))
+                    self.add_sedge(typed_snode, type_snode, SEdgeType.TypedWith)
 
         def get_all_names_subhandler(top_node) -> List[SNode]:
             """
@@ -717,24 +1020,56 @@ class SVisitor:
 
         # AST traversal
         logger.info(f'Starting third pass for file {module_snode.fullname} (package: {module_snode.packagename})')
-        tree = module_snode.attrs.get('__ast__')  # AST saved in second pass
-        module_snode.add_to_attrs(docstring=ast.get_docstring(tree))
+        tree = module_snode.get_attr('__ast__')  # AST saved in first pass
+        if tree is None:
+            # second pass ran from a summary
+            tree = ast.parse(self.get_code(module_snode))
+        name_dotstrings = module_snode.get_attr('__name_dotstrings__', {})
+        self.add_to_attrs(module_snode, docstring=ast.get_docstring(tree))
         self.stack = deque()
         self.stack.append((module_snode, tree, ))
 
         while self.stack:
             top_snode, curr_node = self.stack.popleft()
+            self.lineno = getattr(curr_node, 'lineno', None)
             handler = handlers_dict.get(curr_node.__class__, default_handler)
             try:
                 handler()
             except Exception as e:
                 logger.critical(f'Unexpected exception {e} for {top_snode=} and {curr_node=}, traceback...\n{traceback.print_exc()}')
+        self.lineno = None
 
     def add_snodes(self, *nodes) -> None:
         self.sgraph.add_snodes(*nodes)
-
-    def add_sedges(self, *edges) -> None:
-        self.sgraph.add_sedges(*edges)
+        if self.journal is not None:
+            self.journal.extend(
+                ('snode', node.fullname, node.name, node.namespace, node.modulename, node.packagename, node.snodetype, node.scope_parent.fullname)
+                for node in nodes
+            )
+
+    def add_sedge(self, first: SNode, second: SNode, sedgetype: SEdgeType, **attrs) -> None:
+        self.sgraph.add_edge(first, second, sedgetype, line=self.lineno, **attrs)
+        if self.journal is not None:
+            self.journal.append(('sedge', first.fullname, second.fullname, sedgetype, attrs, self.lineno))
+
+    def add_to_attrs(self, snode: SNode, **attrs) -> None:
+        snode.add_to_attrs(**attrs)
+        if self.journal is not None:
+            self.journal.append(('attrs', snode.fullname, attrs))
+        if self.on_attrs is not None:
+            self.on_attrs(snode)
+
+    def update_scope(self, snode: SNode, new_dict: Dict) -> None:
+        """
+        add to scope of snode only,
+        cf. propagate_scope
+        """
+        self.scopes.bind(snode, new_dict, propagate=False)
+        self.forget_names(new_dict)
+        if self.journal is not None:
+            self.journal.append(('scope', snode.fullname, new_dict))
+        if snode.snodetype is SNodeType.Package:
+            self.index_scope(snode, new_dict)
 
     def get_snode(self, fullname) -> SNode:
         """
@@ -748,24 +1083,77 @@ class SVisitor:
         for given scope and name, get unique
         SNode it refers to
         """
+        stats = self.resolve_stats
+        stats['calls'] += 1
         if isinstance(name, Dotstring):
-            name, suffix = name.first, name.wo_first
+            name, _, suffix = name.partition('.')
         else:
             suffix = ''
 
-        fullname = top_snode.fullname.concat(name)
-        while fullname not in top_snode.scope_dict and top_snode.scope_parent is not None:
-            top_snode = top_snode.scope_parent
-            fullname = top_snode.fullname.concat(name)
-        fullname = Dotstring(top_snode.scope_dict.get(fullname))
+        # only single blocks are cached, cf. forget_names
+        cacheable = bool(name) and '.' not in name
+        cached = self.name_cache.get(name) if cacheable else None
+        if cached is not None and top_snode in cached:
+            stats['hits'] += 1
+            fullname = cached[top_snode]
+        else:
+            stats['misses'] += 1
+            scope_snode = top_snode
+            fullname = scope_snode.fullname.joined(name)
+            while not self.scopes.contains(scope_snode, fullname) and scope_snode.scope_parent is not None:
+                scope_snode = scope_snode.scope_parent
+                fullname = scope_snode.fullname.joined(name)
+            fullname = Dotstring(self.scopes.get(scope_snode, fullname))
+            if cacheable:
+                self.name_cache.setdefault(name, {})[top_snode] = fullname
 
         if fullname is not None:
-            return self.get_snode(fullname.concat(suffix))
+            return self.get_snode(fullname.joined(suffix) if suffix else fullname)
         elif allow_none:
             return None
         else:
             raise KeyError(f'{name=} in {top_snode} could not be resolved.')
 
+    def build_module_index(self, root_snode: SNode) -> None:
+        """
+        rank packages and index the modules and packages found
+        in traversal under each enclosing package
+        """
+        self.module_index = {}
+        self.package_rank = {}
+        self.import_memo = {}
+
+        # rank packages in depth-first order
+        stack = [root_snode]
+        while stack:
+            package_snode = stack.pop()
+            self.package_rank[package_snode] = len(self.package_rank)
+            stack.extend(
+                snode for snode in package_snode.get_attr('__imports_from__')[::-1]
+                if snode.snodetype is SNodeType.Package and snode not in self.package_rank
+            )
+
+        for package_snode in self.package_rank:
+            self.index_scope(package_snode, dict(self.scopes.items(package_snode)))
+
+    def index_scope(self, package_snode: SNode, new_dict: Dict) -> None:
+        """
+        add new keys of a package scope to module_index and
+        forget resolved imports they could change
+        """
+        rank = self.package_rank.get(package_snode)
+        if rank is None:
+            # packages are ranked once the traversal is done
+            return
+
+        prefix = package_snode.fullname + '.'
+        for local_fullname in new_dict:
+            self.import_memo.pop(local_fullname, None)
+            if local_fullname.startswith(prefix):
+                name = str.__getitem__(local_fullname, slice(len(prefix), None))
+                self.import_memo.pop(name, None)
+                self.module_index.setdefault(name.split('.', 1)[0], {})[package_snode] = rank
+
     def resolve_import(self, top_snode: SNode, module_name: str | Dotstring, level: int | None = None) -> SNode | None:
         """
         for relative or absolute import,
@@ -776,40 +1164,211 @@ class SVisitor:
         if top_snode.snodetype is SNodeType.Module:
             top_snode = top_snode.scope_parent
 
+        memo = self.import_memo.setdefault(module_name, {})
+        key = (top_snode.fullname, level or 0)
+        if key in memo:
+            return memo[key]
+
         if level is None or level == 0:
             # absolute import
             top_snode = self.get_snode(self.root_namespace)
 
             # if module_name is absolute
-            if module_name in top_snode.scope_dict:
-                return self.get_snode(top_snode.scope_dict.get(module_name))
-
-            stack = deque()
-            stack.append(top_snode)
-            snode_set = set()  # prevent infinite stack
-
-            while stack:
-                top_snode = stack.pop()
-                if (module_fullname := top_snode.fullname.concat(module_name)) in top_snode.scope_dict:
-                    return self.get_snode(top_snode.scope_dict.get(module_fullname))
-                else:
-                    for package_snode in [snode for snode in top_snode.attrs.get('__imports_from__')[::-1] if snode.snodetype is SNodeType.Package]:
-                        if package_snode not in snode_set:
-                            stack.append(package_snode)
-                            snode_set.add(package_snode)
-            return None
+            if self.scopes.contains(top_snode, module_name):
+                imported_snode = self.get_snode(self.scopes.get(top_snode, module_name))
+            else:
+                # first package, in depth-first order, that has module_name in its scope
+                imported_snode = None
+                packages = self.module_index.get(module_name.first, {})
+                for package_snode in sorted(packages, key=packages.get):
+                    if self.scopes.contains(package_snode, module_fullname := package_snode.fullname.concat(module_name)):
+                        imported_snode = self.get_snode(self.scopes.get(package_snode, module_fullname))
+                        break
         else:
             # relative import
             for _ in range(level-1):
                 top_snode = top_snode.scope_parent
             module_fullname = top_snode.fullname.concat(module_name)
-            return self.get_snode(top_snode.scope_dict.get(module_fullname))
+            imported_snode = self.get_snode(self.scopes.get(top_snode, module_fullname))
+
+        memo[key] = imported_snode
+        return imported_snode
+
+    def forget_names(self, new_dict: Dict) -> None:
+        """
+        drop cached resolutions that new bindings may change,
+        a key can only be looked up by resolve_name as its last block
+        """
+        if not self.name_cache:
+            return
+        for key in new_dict:
+            self.name_cache.pop(key.rpartition('.')[2], None)
 
     def propagate_scope(self, current_snode: SNode, new_dict: Dict) -> None:
         """
         propagate elements of scope
-        to successive parents
+        to successive parents, the bindings are only stored
+        in current_snode and found from parents through self.scopes
         """
+        if self.journal is not None:
+            self.journal.append(('propagate', current_snode.fullname, new_dict))
+
+        self.scopes.bind(current_snode, new_dict)
+        self.forget_names(new_dict)
         while current_snode is not None:
-            current_snode.scope_dict.update(new_dict)
+            if current_snode.snodetype is SNodeType.Package:
+                self.index_scope(current_snode, new_dict)
             current_snode = current_snode.scope_parent
+
+    def replay(self, journal: List[Tuple]) -> None:
+        """
+        repeat third pass changes
+        recorded for an unchanged module
+        """
+        for entry in journal:
+            if entry[0] == 'snode':
+                _, fullname, name, namespace, modulename, packagename, snodetype, parent_fullname = entry
+                self.add_snodes(SNode(
+                    fullname=fullname,
+                    name=name,
+                    namespace=namespace,
+                    modulename=modulename,
+                    packagename=packagename,
+                    snodetype=snodetype,
+                    scope_dict={},
+                    scope_parent=self.get_snode(parent_fullname),
+                ))
+            elif entry[0] == 'sedge':
+                _, first_fullname, second_fullname, sedgetype, attrs, self.lineno = entry
+                self.add_sedge(self.get_snode(first_fullname), self.get_snode(second_fullname), sedgetype, **attrs)
+            elif entry[0] == 'attrs':
+                self.add_to_attrs(self.get_snode(entry[1]), **entry[2])
+            elif entry[0] == 'scope':
+                self.update_scope(self.get_snode(entry[1]), entry[2])
+            elif entry[0] == 'propagate':
+                self.propagate_scope(self.get_snode(entry[1]), entry[2])
+        self.lineno = None
+
+    def can_replay(self, journal: List[Tuple]) -> bool:
+        """
+        check that all snodes referenced by a journal
+        exist or are created by it
+        """
+        created = set()
+        for entry in journal:
+            if entry[0] == 'snode':
+                referenced = [entry[-1]]
+                created.add(entry[1])
+            elif entry[0] == 'sedge':
+                if len(entry) != 6:
+                    # recorded before edges had line numbers
+                    return False
+                referenced = [entry[1], entry[2]]
+            else:
+                referenced = [entry[1]]
+
+            if any(fullname not in created and fullname not in self.sgraph.snodes for fullname in referenced):
+                return False
+        return True
+
+    def affected_modules(self, state: Dict) -> Set[Dotstring]:
+        """
+        fullnames of modules that changed since the last scan and,
+        transitively, of modules importing them
+        """
+        # reverse imports of both scans
+        imported_to: Dict[Dotstring, Set[Dotstring]] = {}
+        for importer, imported_list in chain(self.imports_from_dict().items(), state['imports_from'].items()):
+            for imported in imported_list:
+                imported_to.setdefault(imported, set()).add(importer)
+
+        stack = deque(
+            fullname for fullname, snode in self.sgraph.snodes.items()
+            if snode.get_attr('__contenthash__') is not None and state['modules'].get(fullname, {}).get('hash') != snode.get_attr('__contenthash__')
+        )
+        stack.extend(fullname for fullname in state['modules'] if fullname not in self.sgraph.snodes)
+
+        affected = set(stack)
+        while stack:
+            for importer in imported_to.get(stack.pop(), ()):
+                if importer not in affected:
+                    affected.add(importer)
+                    stack.append(importer)
+        return affected
+
+    def imports_from_dict(self) -> Dict[Dotstring, List[Dotstring]]:
+        """
+        __imports_from__ of all modules and packages
+        as {fullname: [imported fullnames]}
+        """
+        return {
+            fullname: [imported_snode.fullname for imported_snode in snode.get_attr('__imports_from__')]
+            for fullname, snode in self.sgraph.snodes.items() if snode.get_attr('__imports_from__') is not None
+        }
+
+    @staticmethod
+    def load_state(state_path: pathlib.Path) -> Dict:
+        empty_state = {'version': sys.version_info[:2], 'modules': {}, 'imports_from': {}, 'snodes': set(), 'sedges': set()}
+        if not state_path.exists():
+            logger.info(f'No scan state at {state_path}, scanning all modules.')
+            return empty_state
+
+        with open(state_path, 'rb') as file:
+            state = pickle.load(file)
+
+        if state.get('version') != empty_state['version']:
+            logger.warning(f'Scan state at {state_path} was made with another Python version, scanning all modules.')
+            return empty_state
+        return state
+
+    def save_state(self, state_path: pathlib.Path, state: Dict, module_list: List[SNode], summary_dict: Dict, journals: Dict) -> None:
+        """
+        save summaries and third pass journals,
+        also set self.delta with respect to the previous state
+        """
+        snodes = set(self.sgraph.snodes)
+        sedges = set(self.sgraph.edge_triples())
+        self.delta = {
+            'snodes': (snodes - state['snodes'], state['snodes'] - snodes),
+            'sedges': (sedges - state['sedges'], state['sedges'] - sedges),
+        }
+
+        new_state = {
+            'version': state['version'],
+            'modules': {
+                module_snode.fullname: {
+                    'hash': module_snode.get_attr('__contenthash__'),
+                    'summary': summary_dict.get(module_snode.fullname),
+                    'journal': journals.get(module_snode.fullname),
+                }
+                for module_snode in module_list
+            },
+            'imports_from': self.imports_from_dict(),
+            'snodes': snodes,
+            'sedges': sedges,
+        }
+
+        with open(state_path, 'wb') as file:
+            pickle.dump(new_state, file)
+        logger.info(f'Saved scan state to {state_path}')
+
+
+# source of the package scanned, in summarize_modules workers
+_worker_source: SourceTree | None = None
+
+
+def _set_worker_source(source: SourceTree) -> None:
+    global _worker_source
+    _worker_source = source
+
+
+def _summarize_module_or_none(code: str | None, filepath) -> Tuple[Tuple[Tuple, List[Tuple]] | None, float]:
+    """
+    summary of a module and the seconds it took
+    """
+    start = time.perf_counter()
+    if code is None and filepath is not None:
+        # low memory mode, the source is read in the worker
+        code = _worker_source.read(filepath)
+    summary = summarize_module(code, filepath) if code is not None else None
+    return summary, time.perf_counter() - start
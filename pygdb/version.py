@@ -0,0 +1,5 @@
+"""
+version of pygdb, part of
+the key of cached module summaries
+"""
+__version__ = '0.1.0'